@@ -1,59 +1,314 @@
 from fastapi import FastAPI, Request, Response, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
-import sqlite3
+import asyncio
+import glob
+import hashlib
+import html
 import os
-from starlette.middleware.sessions import SessionMiddleware
+import secrets
+import time
+from contextlib import contextmanager
+import jinja2
+import catalogue
+import compression
+import db
+import metrics
+import sessions
+import throttle
+import track_search
+
+# Timings exposed at /metrics
+HTTP_LATENCY = metrics.Histogram(
+    "radio_http_request_duration_seconds", "HTTP request latency by route", label="route")
+HTTP_RESPONSE_SIZE = metrics.Histogram(
+    "radio_http_response_size_bytes", "HTTP response body size by route",
+    buckets=metrics.SIZE_BUCKETS, label="route")
+DB_QUERY_SECONDS = metrics.Histogram(
+    "radio_db_query_duration_seconds", "Time a search holds a database connection")
+TEMPLATE_RENDER_SECONDS = metrics.Histogram(
+    "radio_template_render_duration_seconds", "Template render time", label="template")
+
+# Session data stays on the server; the cookie only holds its id
+session_store = sessions.make_store()
 
 app = FastAPI()
-app.add_middleware(SessionMiddleware, secret_key="your-secret-key-here")  # Change in production
-templates = Jinja2Templates(directory="templates")
+app.add_middleware(sessions.ServerSessionMiddleware, store=session_store)
+# Inside the metrics middleware, so response sizes are what goes over the wire
+app.add_middleware(compression.CompressionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware, latency=HTTP_LATENCY, size=HTTP_RESPONSE_SIZE)
+
+def make_template_env(cache_dir):
+    """Jinja2 environment whose compiled templates are cached on disk"""
+    os.makedirs(cache_dir, exist_ok=True)
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader("templates"),
+        autoescape=True,
+        bytecode_cache=jinja2.FileSystemBytecodeCache(cache_dir),
+    )
+
+# Bytecode cache lets a freshly started worker skip parsing the templates
+TEMPLATE_CACHE_DIR = os.environ.get("RADIO_TEMPLATE_CACHE_DIR", ".jinja_cache")
+templates = Jinja2Templates(env=make_template_env(TEMPLATE_CACHE_DIR))
 
-# Mount the static files directory
-app.mount("/static", StaticFiles(directory="css"), name="static")
+# Mount the static files directory; precompress.py writes the .gz/.br copies it serves
+app.mount("/static", compression.PrecompressedStaticFiles(directory="css"), name="static")
 
 ADMIN_PASSWORD = "nulaR0rula"  # Your specified password
 
+# Rows per results page; further pages load as the user scrolls
+SEARCH_PAGE_SIZE = int(os.environ.get("RADIO_SEARCH_PAGE_SIZE", 100))
+# Stream every match as it is read from the cursor instead of paginating
+SEARCH_STREAM = os.environ.get("RADIO_SEARCH_STREAM", "0") == "1"
+STREAM_BATCH_SIZE = 500
+# Pooled connections streamed searches may hold at once. A stream keeps its
+# connection until the client has read every row, so the rest of the pool is
+# left for other searches; when all are taken, the first page is sent instead.
+STREAM_CONNECTIONS = int(os.environ.get("RADIO_SEARCH_STREAM_CONNECTIONS", db.POOL_SIZE // 2))
+# "sqlite" searches the database (FTS5 index, or LIKE without it);
+# "memory" searches a packed in-memory copy of the tracks table
+SEARCH_ENGINE = os.environ.get("RADIO_SEARCH_ENGINE", "sqlite")
+# "alphabetical" lists every match page by page; "relevance" shows only the
+# best page of matches (exact and phrase matches first). Users can switch.
+SEARCH_ORDER = os.environ.get("RADIO_SEARCH_ORDER", "alphabetical")
+# Typo-tolerant trigram search, used for mode=fuzzy
+FUZZY_SEARCH = os.environ.get("RADIO_FUZZY_SEARCH", "1") == "1"
+# Also answer searches that find nothing with fuzzy matches. Each one scans
+# the trigram index (tens of milliseconds on large catalogues, more for
+# short queries), so it is opt-in and skipped for queries shorter than this
+FUZZY_FALLBACK = os.environ.get("RADIO_FUZZY_FALLBACK", "0") == "1"
+FUZZY_FALLBACK_MIN_LENGTH = 4
+# Switch to a new radio.db (e.g. a symlink pointed at a new file) without a restart
+HOT_RELOAD = os.environ.get("RADIO_HOT_RELOAD", "1") == "1"
+
+# Long-lived connections shared by all requests (see db.py for settings)
+db_pool = db.ConnectionPool()
+# Worker threads that run queries so they never block the event loop
+query_executor = db.QueryExecutor()
+stream_slots = asyncio.Semaphore(STREAM_CONNECTIONS)
+# Identical concurrent searches run once; a session's superseded searches are
+# dropped, and each session gets a budget of searches per second
+search_flights = throttle.SingleFlight(query_executor)
+search_sessions = throttle.SessionCoalescer()
+search_limiter = throttle.RateLimiter()
+
+@contextmanager
 def get_db_connection():
-    """Connect to SQLite database"""
-    conn = sqlite3.connect('radio.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def search_tracks(query):
-    """Search tracks in the database"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    """Borrow a pooled connection to the SQLite database"""
+    started = time.perf_counter()
+    with db_pool.connection() as conn:
+        yield conn
+    DB_QUERY_SECONDS.observe(time.perf_counter() - started)
+
+def render_page(request, name, context=None):
+    """Render a full-page template, recording how long it took"""
+    with TEMPLATE_RENDER_SECONDS.time(name):
+        return templates.TemplateResponse(request, name, context or {})
+
+def render_results(**context):
+    """Render the search results fragment, recording how long it took"""
+    with TEMPLATE_RENDER_SECONDS.time(results_template.name):
+        return results_template.render(**context)
+
+# Cached results per normalised query, dropped when the tracks table changes
+catalogue_version = db.CatalogueVersion()
+search_cache = track_search.SearchCache(catalogue_version.current)
+# Each session's previous result set, narrowed in memory as the query grows
+refinements = track_search.RefinementStore()
+# Only loaded when the in-memory engine is selected
+memory_catalogue = catalogue.MemoryCatalogue() if SEARCH_ENGINE == "memory" else None
+# Trigram index, built in the background at startup
+fuzzy_catalogue = catalogue.MemoryCatalogue(snapshot_class=catalogue.TrigramIndex) if FUZZY_SEARCH else None
+
+def search_tracks(query, after=None, limit=None, session_id=None):
+    """Search tracks in the database, one page at a time"""
+    key = track_search.cache_key(query)
+    if not key:
+        return []
+
+    if memory_catalogue is not None:
+        # Fast enough without the result cache, and reloads on its own
+        tracks = memory_catalogue.search(track_search.normalize_query(query), after, limit)
+        return [{"track": track} for track in tracks]
+
+    cache_key = (key, after, limit)
+    results, generation = search_cache.get(cache_key)
+    if results is not None:
+        return results
+
+    tracks = refinements.narrow(session_id, key, generation)
+    if tracks is not None:
+        results = [{"track": track} for track in track_search.page(tracks, after, limit)]
+    elif after is None and session_id is not None and limit is not None:
+        # Fetch enough of a first page to keep the whole result set for
+        # narrowing the next keystroke, when it is small enough
+        fetch = max(limit, refinements.max_rows + 1)
+        with get_db_connection() as conn:
+            tracks = [row["track"] for row in track_search.search(conn, query, None, fetch)]
+        refinements.remember(session_id, key, tracks, generation)
+        results = [{"track": track} for track in tracks[:limit]]
+    else:
+        with get_db_connection() as conn:
+            results = [dict(row) for row in track_search.search(conn, query, after, limit)]
+    search_cache.put(cache_key, results, generation)
     
-    words = query.split()
+    return results
+
+def rank_tracks(query, limit):
+    """Best matching tracks in the database, most relevant first"""
+    words = track_search.normalize_query(query)
     if not words:
         return []
-    
-    # Search for tracks containing all words (case-insensitive)
-    sql_conditions = " AND ".join(["LOWER(track) LIKE ?" for _ in words])
-    sql_query = f"SELECT DISTINCT track FROM tracks WHERE {sql_conditions} ORDER BY track"
-    params = [f"%{word.lower()}%" for word in words]
-    
-    cursor.execute(sql_query, params)
-    results = cursor.fetchall()
-    conn.close()
-    
-    return [dict(row) for row in results]
+
+    if memory_catalogue is not None:
+        return [{"track": track} for track in memory_catalogue.search_ranked(words, limit)]
+
+    # Word order matters for phrase matches, so the key is not the word set
+    cache_key = ("relevance", tuple(words), limit)
+    results, generation = search_cache.get(cache_key)
+    if results is None:
+        with get_db_connection() as conn:
+            results = [dict(row) for row in track_search.search_ranked(conn, query, limit)]
+        search_cache.put(cache_key, results, generation)
+    return results
+
+def reload_catalogue():
+    """Move every reader over to a replaced radio.db.
+
+    Runs on the watcher thread: the new file's indexes and in-memory
+    engines are built and warmed while searches keep being served from the
+    old one, then the pool, the engines and the result cache switch over
+    together. If any step fails, everything stays on the old file.
+    """
+    fts = []
+    was_fts = track_search.fts_in_use()
+
+    def prepare(conn):
+        if not fts:
+            fts.append(track_search.build_search_index(conn))
+            track_search.warm_search_index(conn)
+            if not fts[0]:
+                # LIKE works on either file, so it is safe to switch early
+                track_search.use_fts(False)
+        else:
+            conn.execute("SELECT 1 FROM tracks LIMIT 1").fetchall()
+
+    engines = [engine for engine in (memory_catalogue, fuzzy_catalogue) if engine is not None]
+    try:
+        snapshots = [engine.prepare() for engine in engines]
+        db_pool.reopen(warm=prepare)
+    except BaseException:
+        track_search.use_fts(was_fts)
+        raise
+    for engine, snapshot in zip(engines, snapshots):
+        engine.install(snapshot)
+    catalogue_version.reopen()
+    track_search.use_fts(fts[0])
+
+catalogue_watcher = db.CatalogueWatcher(reload_catalogue, check_interval=catalogue.RELOAD_CHECK_INTERVAL)
 
 # Ensure templates directory exists
 if not os.path.exists("templates"):
     os.makedirs("templates")
 
+# Compiled once; its macros render the pieces of partial /search responses
+results_template = templates.get_template("_search_results.html")
+results_fragment = results_template.module
+
+# Pages must be revalidated before reuse; only the login form can be shared.
+# Any response that sets the session cookie is made private by the session
+# middleware, so a shared cache never stores a session id.
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+LOGIN_CACHE_CONTROL = "public, max-age=300"
+
+def _render_version():
+    """Hash of the templates and this module, so a deploy changes every ETag"""
+    digest = hashlib.blake2b(digest_size=8)
+    for path in [__file__] + sorted(glob.glob("templates/*.html")):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+RENDER_VERSION = _render_version()
+
+def make_etag(*parts):
+    """ETag for a response fully determined by ``parts``.
+
+    Weak, since compression may change the bytes but not the content.
+    """
+    digest = hashlib.blake2b(repr((RENDER_VERSION,) + parts).encode(), digest_size=12)
+    return f'W/"{digest.hexdigest()}"'
+
+def not_modified(request, etag, cache_control):
+    """A 304 response if the client already has this ETag, otherwise None"""
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return None
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    if "*" in tags or etag.removeprefix("W/") in tags:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+    return None
+
+def with_validators(response, etag, cache_control):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+def search_etag(q, after, fuzzy, ranked):
+    """ETag of a /search response: the catalogue file's state, the search
+    settings and the normalised query (browsers only compare it with the
+    response they hold for the same URL)"""
+    # The in-memory engines answer from a snapshot that is reloaded in the
+    # background after the file changes, so their results follow the
+    # snapshot, not the file. Taken before searching: if a reload lands in
+    # between, the next revalidation misses instead of keeping stale results.
+    snapshots = tuple(engine.snapshot_mtime() if engine is not None else None
+                      for engine in (memory_catalogue, fuzzy_catalogue))
+    return make_etag(
+        "search", db.file_fingerprint(db_pool.target), snapshots, track_search.fts_in_use(),
+        SEARCH_ENGINE, SEARCH_PAGE_SIZE, SEARCH_STREAM, fuzzy_catalogue is not None, FUZZY_FALLBACK,
+        tuple(track_search.normalize_query(q)), after, fuzzy, ranked,
+    )
+
+@app.on_event("startup")
+def build_search_index():
+    """Build the full-text search index (falls back to LIKE without FTS5)"""
+    with get_db_connection() as conn:
+        track_search.init_search_index(conn)
+    if memory_catalogue is not None:
+        memory_catalogue.load()
+    if fuzzy_catalogue is not None:
+        # Takes seconds on large catalogues; the server is up meanwhile
+        fuzzy_catalogue.start_loading()
+    if HOT_RELOAD:
+        catalogue_watcher.start()
+
+@app.on_event("shutdown")
+def close_db_pool():
+    catalogue_watcher.stop()
+    query_executor.shutdown()
+    catalogue_version.close()
+    db_pool.close()
+    session_store.close()
+
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     if not request.session.get("authenticated"):
         return RedirectResponse(url="/login")
-    return templates.TemplateResponse("index.html", {"request": request})
+    etag = make_etag("index", SEARCH_ORDER)
+    cached = not_modified(request, etag, PRIVATE_CACHE_CONTROL)
+    if cached is not None:
+        return cached
+    response = render_page(request, "index.html", {"search_order": SEARCH_ORDER})
+    return with_validators(response, etag, PRIVATE_CACHE_CONTROL)
 
 @app.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request})
+    etag = make_etag("login")
+    cached = not_modified(request, etag, LOGIN_CACHE_CONTROL)
+    if cached is not None:
+        return cached
+    return with_validators(render_page(request, "login.html"), etag, LOGIN_CACHE_CONTROL)
 
 @app.post("/login", response_class=HTMLResponse)
 async def login(request: Request):
@@ -62,57 +317,220 @@ async def login(request: Request):
     
     if password == ADMIN_PASSWORD:
         request.session["authenticated"] = True
+        # Keys this session's refinements, superseded searches and rate limit
+        request.session["search_id"] = secrets.token_urlsafe(12)
         return RedirectResponse(url="/", status_code=303)
     
-    return templates.TemplateResponse(
-        "login.html", 
-        {"request": request, "error": "Incorrect password"}
-    )
+    return render_page(request, "login.html", {"error": "Incorrect password"})
 
 @app.get("/logout")
 async def logout(request: Request):
     request.session.clear()
     return RedirectResponse(url="/login", status_code=303)
 
-@app.post("/search", response_class=HTMLResponse)
+@app.api_route("/search", methods=["GET", "POST"], response_class=HTMLResponse)
 async def search(request: Request):
     if not request.session.get("authenticated"):
         return RedirectResponse(url="/login")
         
-    form = await request.form()
+    # The page searches with GET so browsers can revalidate cached results
+    form = request.query_params if request.method == "GET" else await request.form()
     q = form.get("q", "").strip()
-    
+    after = form.get("after") or None
+    fuzzy = fuzzy_catalogue is not None and form.get("mode") == "fuzzy"
+    ranked = (form.get("order") or SEARCH_ORDER) == "relevance"
+    session_id = request.session.setdefault("search_id", secrets.token_urlsafe(12))
+
+    # A new query from the same session (even an empty or cached one)
+    # supersedes this one; next pages are requested by scrolling, not
+    # typing, so they always run
+    wanted = None
+    if after is None:
+        ticket = search_sessions.begin(session_id)
+
+        def wanted():
+            return search_sessions.is_current(session_id, ticket)
+
+    etag = search_etag(q, after, fuzzy, ranked)
+    cached = not_modified(request, etag, PRIVATE_CACHE_CONTROL)
+    if cached is not None:
+        return cached
+
+    if not search_limiter.allow(session_id):
+        # htmx leaves the current results in place on an error status
+        return HTMLResponse("Too many searches, slow down", status_code=429,
+                            headers={"Retry-After": str(search_limiter.retry_after(session_id))})
+
     if not q:
         # Use a simple div without role="alert"
-        return HTMLResponse("""
+        return with_validators(HTMLResponse("""
             <div class="text-gray-500">Enter a search term to find tracks</div>
-        """)
+        """), etag, PRIVATE_CACHE_CONTROL)
+
+    try:
+        response = await run_search(q, after, fuzzy, ranked, session_id, wanted)
+    except throttle.Superseded:
+        response = None
+    if wanted is not None and not wanted():
+        # A newer search from this session will replace the results anyway
+        search_sessions.drop()
+        return Response(status_code=204)
+    return with_validators(response, etag, PRIVATE_CACHE_CONTROL)
+
+async def run_search(q, after, fuzzy, ranked, session_id, wanted):
+    """Search and render the /search response"""
+    if fuzzy:
+        matches = await search_flights.run(("fuzzy", q), fuzzy_catalogue.search, q, wanted=wanted)
+        return HTMLResponse(render_fuzzy_results(q, matches, f"Closest matches for: {q}"))
+    
+    if ranked:
+        # Only the top page is ever fetched, so there is nothing more to load
+        key = ("relevance", tuple(track_search.normalize_query(q)))
+        results = await search_flights.run(key, rank_tracks, q, SEARCH_PAGE_SIZE, wanted=wanted)
+        has_more = False
+    elif SEARCH_STREAM and after is None and not stream_slots.locked():
+        return StreamingResponse(stream_search_results(q), media_type="text/html")
+    else:
+        # Fetch one extra row to find out whether there is another page
+        key = ("page", track_search.cache_key(q), after)
+        results = await search_flights.run(
+            key, search_tracks, q, after, SEARCH_PAGE_SIZE + 1, session_id, wanted=wanted)
+        has_more = len(results) > SEARCH_PAGE_SIZE
+        results = results[:SEARCH_PAGE_SIZE]
+    next_after = results[-1]["track"] if has_more else None
     
-    results = search_tracks(q)
+    if after is not None:
+        # Next page: rows replace the "load more" row at the end of the table
+        rows = results_fragment.track_rows(results)
+        if next_after is not None:
+            rows += results_fragment.load_more(q, next_after)
+        return HTMLResponse(rows)
+    
+    if not results and use_fuzzy_fallback(q):
+        matches = await search_flights.run(("fuzzy", q), fuzzy_catalogue.search, q, wanted=wanted)
+        if matches:
+            return HTMLResponse(render_fuzzy_results(
+                q, matches, f"No exact matches for: {q}. Closest tracks:"))
     
     if not results:
         # Use a simple div without role="alert"
         return HTMLResponse(f"""
-            <div class="text-amber-600 dark:text-amber-400 py-2">No matching tracks found for: {q}</div>
+            <div class="text-amber-600 dark:text-amber-400 py-2">No matching tracks found for: {html.escape(q)}</div>
         """)
     
-    # Add Tailwind classes for better styling
-    results_html = f"""
-        <div>
-            <div class="text-gray-500 text-sm mb-2">Found {len(results)} tracks matching: {q}</div>
-            <table class="w-full">
-                <thead class="bg-gray-100 dark:bg-gray-800">
-                    <tr>
-                        <th class="text-left py-2 px-3">Track</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    {"".join(f'<tr class="border-b border-gray-200 dark:border-gray-700 hover:bg-gray-50 dark:hover:bg-gray-800"><td class="py-3 px-3">{result["track"]}</td></tr>' for result in results)}
-                </tbody>
-            </table>
-        </div>
-    """
-    return HTMLResponse(results_html)
+    if ranked:
+        heading = f"Best {len(results)} matches for: {q}"
+    else:
+        count = f"{len(results)}+" if has_more else len(results)
+        heading = f"Found {count} tracks matching: {q}"
+    return HTMLResponse(render_results(
+        heading=heading, results=results, q=q, next_after=next_after
+    ))
+
+def use_fuzzy_fallback(q):
+    """Whether a search that found nothing should try fuzzy matches"""
+    # Never waits for the trigram index to be built
+    return (FUZZY_FALLBACK and fuzzy_catalogue is not None and fuzzy_catalogue.ready()
+            and len(q.strip()) >= FUZZY_FALLBACK_MIN_LENGTH)
+
+def render_fuzzy_results(q, matches, heading):
+    """Render trigram search matches, best first"""
+    if not matches:
+        return f"""
+            <div class="text-amber-600 dark:text-amber-400 py-2">No similar tracks found for: {html.escape(q)}</div>
+        """
+    return render_results(
+        heading=heading, results=[{"track": track} for track, _ in matches], q=q, next_after=None
+    )
+
+def call_result(call):
+    """Result of a finished executor call; None if it failed or was cancelled"""
+    if call is None or call.cancelled() or call.exception() is not None:
+        return None
+    return call.result()
+
+def close_stream(conn_call, cursor_call):
+    """Close a streamed search's cursor and return its connection to the pool"""
+    cursor, conn = call_result(cursor_call), call_result(conn_call)
+    try:
+        if cursor is not None:
+            cursor.close()
+    finally:
+        if conn is not None:
+            db_pool.release(conn)
+
+async def stream_search_results(q):
+    """Yield the results table as rows are read from the database cursor"""
+    async with stream_slots:
+        conn_call = last_call = query_executor.submit(db_pool.acquire)
+        cursor_call = None
+        try:
+            conn = await asyncio.wrap_future(conn_call)
+            cursor_call = last_call = query_executor.submit(track_search.execute_search, conn, q)
+            cursor = await asyncio.wrap_future(cursor_call)
+            yield results_fragment.table_start(f"Tracks matching: {q}")
+            count = 0
+            while True:
+                last_call = query_executor.submit(cursor.fetchmany, STREAM_BATCH_SIZE)
+                rows = await asyncio.wrap_future(last_call)
+                if not rows:
+                    break
+                count += len(rows)
+                yield results_fragment.track_rows(rows)
+            summary = f"Found {count} tracks" if count else f"No matching tracks found for: {q}"
+            yield results_fragment.table_end(summary)
+        finally:
+            # When the client disconnects, the last call may still be running on
+            # a worker; the cursor and connection are only touched once it is done
+            last_call.add_done_callback(
+                lambda _: query_executor.submit(close_stream, conn_call, cursor_call))
+
+def stats_sections():
+    """Database pool, query queue and result cache usage"""
+    return {
+        "db_pool": db_pool.stats(),
+        "queries": query_executor.stats(),
+        "search_cache": search_cache.stats(),
+        "refinements": refinements.stats(),
+        "memory_catalogue": memory_catalogue.stats() if memory_catalogue else None,
+        "fuzzy_catalogue": fuzzy_catalogue.stats() if fuzzy_catalogue else None,
+        "slow_queries": track_search.slow_queries.stats(),
+        "catalogue_file": catalogue_watcher.stats(),
+        "sessions": session_store.stats(),
+        "search_flights": search_flights.stats(),
+        "search_sessions": search_sessions.stats(),
+        "search_rate_limit": search_limiter.stats(),
+    }
+
+@app.get("/stats")
+async def stats(request: Request):
+    # Includes error messages with file paths, so only for logged-in users
+    if not request.session.get("authenticated"):
+        return RedirectResponse(url="/login")
+    return JSONResponse(stats_sections())
+
+# stats_sections() keys that only ever grow, exported as Prometheus counters
+COUNTER_STATS = {"completed", "hits", "misses", "evictions", "invalidations", "narrowed",
+                 "reloads", "failures", "logged", "started", "shared", "skipped",
+                 "superseded", "limited"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Request, query and render timings plus /stats values, in Prometheus text format"""
+    lines = []
+    for histogram in (HTTP_LATENCY, HTTP_RESPONSE_SIZE, DB_QUERY_SECONDS, TEMPLATE_RENDER_SECONDS):
+        lines += histogram.exposition()
+    # Numbers only: strings such as the last catalogue error are left out,
+    # so scrapers can read it without a session
+    for section, values in stats_sections().items():
+        for key, value in (values or {}).items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            if key in COUNTER_STATS:
+                lines += metrics.sample(f"radio_{section}_{key}_total", value, "counter")
+            else:
+                lines += metrics.sample(f"radio_{section}_{key}", value)
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,60 @@
+import hashlib
+import os
+import tempfile
+
+from fasthtml.common import Link, Mount, Script, StaticImmutable
+
+# Generated files; their names change with their content, so they can be
+# cached forever
+ASSET_DIR = os.environ.get("FASTHTML_ASSET_DIR", os.path.join("static", "assets"))
+ASSET_URL = "/static/assets"
+HASH_LENGTH = 12
+
+
+def write_asset(content, suffix, name="inline", directory=ASSET_DIR):
+    """Write ``content`` to ``name.<hash><suffix>`` once; returns the file name"""
+    data = content.encode("utf-8")
+    filename = f"{name}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{suffix}"
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        # Written aside and renamed, so another worker never serves half a file
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    return filename
+
+
+def externalize(hdrs, directory=ASSET_DIR, url=ASSET_URL):
+    """Replace inline <script> and <style> header tags with fingerprinted files.
+
+    Returns new header tags: inline scripts become ``Script(src=...)``,
+    inline styles ``Link(rel="stylesheet", href=...)``. Other tags are kept.
+    A tag's ``id``, if any, names its file.
+    """
+    rewritten = []
+    for tag in hdrs:
+        name = getattr(tag, "tag", None)
+        attrs = dict(getattr(tag, "attrs", {}))
+        content = "".join(str(child) for child in getattr(tag, "children", ()))
+        if name == "script" and "src" not in attrs and content.strip():
+            filename = write_asset(content, ".js", attrs.get("id", "script"), directory)
+            rewritten.append(Script(src=f"{url}/{filename}", **attrs))
+        elif name == "style" and content.strip():
+            filename = write_asset(content, ".css", attrs.get("id", "style"), directory)
+            rewritten.append(Link(rel="stylesheet", href=f"{url}/{filename}", **attrs))
+        else:
+            rewritten.append(tag)
+    return tuple(rewritten)
+
+
+def mount_assets(app, directory=ASSET_DIR, url=ASSET_URL):
+    """Serve the generated files with ``Cache-Control: immutable``.
+
+    Mounted ahead of FastHTML's catch-all static route, which would
+    otherwise serve them without that header.
+    """
+    os.makedirs(directory, exist_ok=True)
+    app.routes.insert(0, Mount(url, StaticImmutable(directory=directory), name="assets"))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Benchmark serving example.py's static page, rendered per request vs cached.
+
+Requests go straight to the ASGI app (no network or HTTP client), so the
+numbers are the server's own cost per request: building and serialising
+the FT tree each time, serving the cached bytes, and answering a
+revalidation with 304 Not Modified.
+
+Usage:
+    python3 bench_pages.py [--requests N]
+"""
+import argparse
+import asyncio
+import time
+
+import example
+
+UNCACHED_PATH = "/__uncached"
+
+
+async def request(app, path, headers=()):
+    """Send one GET to the ASGI app; returns (status, body, headers)"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": [(b"host", b"localhost")] + list(headers),
+        "client": ("127.0.0.1", 1234), "server": ("localhost", 80),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start = messages[0]
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return start["status"], body, dict(start["headers"])
+
+
+async def throughput(app, path, requests, headers=()):
+    """Requests per second for `requests` sequential GETs of `path`"""
+    await request(app, path, headers)  # warm up (fills the cache)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await request(app, path, headers)
+    return requests / (time.perf_counter() - started)
+
+
+async def run(requests):
+    app = example.app
+    # The same handler without the cache, for comparison
+    app.route(UNCACHED_PATH, methods=["get"])(example.get.render)
+
+    _, page, headers = await request(app, "/")
+    etag = headers[b"etag"]
+    print(f"Page: {len(page):,} bytes, ETag {etag.decode()}\n")
+    print(f"{'':<28} {'req/s':>10} {'us/req':>10}")
+    results = [
+        ("FT render per request", await throughput(app, UNCACHED_PATH, requests)),
+        ("cached bytes", await throughput(app, "/", requests)),
+        ("cached, 304 revalidation", await throughput(app, "/", requests,
+                                                     [(b"if-none-match", etag)])),
+    ]
+    for name, rate in results:
+        print(f"{name:<28} {rate:>10,.0f} {1e6 / rate:>10.1f}")
+    print(f"\nCache speed-up: {results[1][1] / results[0][1]:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
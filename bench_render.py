@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Benchmark rendering of the /search results fragment.
+
+Shows the per-row cost of templates/_search_results.html staying flat as the
+number of rows grows, and the cold-start cost of compiling the templates with
+and without the on-disk bytecode cache.
+
+Usage:
+    python3 bench_render.py [--repeat N]
+"""
+import argparse
+import tempfile
+import time
+
+from app import make_template_env
+
+ROW_COUNTS = [10, 100, 1000, 10000]
+
+
+def render_time(template, rows, repeat):
+    """Best-of-`repeat` seconds to render a first page of `rows` results"""
+    results = [{"track": f"Artist {i} - Title <{i}> & Dub"} for i in range(rows)]
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        template.render(heading="Found tracks", results=results, q="dub", next_after="x")
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def cold_start(cache_dir):
+    """Seconds for a new environment to load every template"""
+    env = make_template_env(cache_dir)
+    started = time.perf_counter()
+    for name in ("index.html", "login.html", "_search_results.html"):
+        env.get_template(name)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        template = make_template_env(cache_dir).get_template("_search_results.html")
+        print(f"{'rows':>8} {'total ms':>10} {'us/row':>8}")
+        for rows in ROW_COUNTS:
+            seconds = render_time(template, rows, args.repeat)
+            print(f"{rows:>8} {seconds * 1000:>10.2f} {seconds / rows * 1e6:>8.2f}")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        compiled = cold_start(cache_dir)
+        cached = cold_start(cache_dir)
+    print(f"\nCold start: {compiled * 1000:.2f} ms compiling, "
+          f"{cached * 1000:.2f} ms from bytecode cache")
+
+
+if __name__ == "__main__":
+    main()
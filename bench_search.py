@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""Benchmark track search engines against a synthetic radio.db.
+
+Generates a catalogue with realistic artist popularity, replays query
+streams (simulated keystrokes or a recorded file) through each search
+engine/config in its own process, and reports latency percentiles,
+throughput and memory. Runs offline.
+
+Usage:
+    python3 bench_search.py [--tracks N] [--db PATH] [--configs a,b,...]
+                            [--queries FILE] [--save FILE] [--compare FILE]
+    python3 bench_search.py --generate-only --tracks 5000000 --db bench.db
+
+Recorded query files hold one query per line, or JSON lines of the form
+{"session": "...", "q": "..."}. Use --save on one run and --compare on a
+later one to spot regressions.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Engine/config -> environment for the app, and how the worker queries it
+CONFIGS = {
+    "like": {"env": {"RADIO_FTS": "0", "RADIO_SEARCH_CACHE_ENTRIES": "0"}, "call": "page"},
+    "fts": {"env": {"RADIO_SEARCH_CACHE_ENTRIES": "0"}, "call": "page"},
+    "fts+cache": {"env": {}, "call": "page"},
+    "fts+refine": {"env": {"RADIO_SEARCH_CACHE_ENTRIES": "0"}, "call": "page", "sessions": True},
+    "default": {"env": {}, "call": "page", "sessions": True},
+    "memory": {"env": {"RADIO_SEARCH_ENGINE": "memory"}, "call": "page"},
+    "ranked": {"env": {"RADIO_SEARCH_CACHE_ENTRIES": "0"}, "call": "ranked"},
+    "fuzzy": {"env": {}, "call": "fuzzy", "misspelled": True},
+}
+DEFAULT_CONFIGS = ["like", "fts", "fts+cache", "default", "memory", "ranked", "fuzzy"]
+
+FIRST_NAMES = ["Lee", "King", "Augustus", "Max", "Sly", "Robbie", "Horace", "Linval", "Mad",
+               "Lady", "Jah", "Dennis", "Gregory", "Marcia", "Björk", "Zoë", "Ana", "Luka",
+               "Mia", "Nina", "Omar", "Ivo", "Tereza", "Ondřej", "Dario", "Kofi", "Ayo"]
+LAST_NAMES = ["Perry", "Tubby", "Pablo", "Romeo", "Dunbar", "Shakespeare", "Andy", "Thompson",
+              "Professor", "Saxon", "Shaka", "Brown", "Isaacs", "Griffiths", "Novak", "Horvat",
+              "Müller", "Dvořák", "Kovač", "Mensah", "Adeyemi", "Silva", "Rossi", "Larsen"]
+BAND_WORDS = ["Sound", "System", "Roots", "Radics", "Rockers", "Dub", "Syndicate", "Lions",
+              "Echo", "Riddim", "Collective", "Orchestra", "Brothers", "Sisters", "Crew",
+              "Disciples", "Foundation", "Siren", "Station", "Night", "Tapes", "Waves"]
+TITLE_WORDS = ["dub", "love", "night", "city", "fire", "rain", "siren", "dread", "version",
+               "heart", "river", "sun", "moon", "dance", "street", "soul", "light", "echo",
+               "time", "road", "dream", "storm", "shadow", "gold", "freedom", "rhythm",
+               "babylon", "zion", "bass", "tape", "horizon", "jungle", "garden", "signal"]
+TITLE_SUFFIXES = ["", "", "", "", " (Dub Mix)", " (Extended)", " (Live)", " (Remastered)",
+                  " (Instrumental)", " - Radio Edit"]
+
+
+def make_artist(rng):
+    kind = rng.random()
+    if kind < 0.45:
+        return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    if kind < 0.8:
+        return "The " + " ".join(rng.sample(BAND_WORDS, rng.randint(1, 2)))
+    if kind < 0.9:
+        return f"DJ {rng.choice(LAST_NAMES)}"
+    return " & ".join(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(2))
+
+
+def make_title(rng):
+    words = rng.sample(TITLE_WORDS, rng.randint(1, 4))
+    return " ".join(words).title() + rng.choice(TITLE_SUFFIXES)
+
+
+def zipf_weights(n, s=1.1):
+    """Cumulative Zipf weights: a few artists get most of the airplay"""
+    total, cumulative = 0.0, []
+    for rank in range(1, n + 1):
+        total += 1 / rank ** s
+        cumulative.append(total)
+    return cumulative
+
+
+def generate_catalogue(path, tracks, seed=42):
+    """Write a radio.db whose tracks table has `tracks` "Artist - Title" rows.
+
+    About one row in ten repeats an earlier track, like a play log. Returns
+    the artists, most played first.
+    """
+    rng = random.Random(seed)
+    artists = list(dict.fromkeys(make_artist(rng) for _ in range(max(50, tracks // 25))))
+    weights = zipf_weights(len(artists))
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE tracks (id INTEGER PRIMARY KEY, track TEXT)")
+    recent = []
+    batch = []
+    for _ in range(tracks):
+        if recent and rng.random() < 0.1:
+            track = rng.choice(recent)
+        else:
+            artist = rng.choices(artists, cum_weights=weights)[0]
+            track = f"{artist} - {make_title(rng)}"
+            if len(recent) < 10000:
+                recent.append(track)
+            else:
+                recent[rng.randrange(len(recent))] = track
+        batch.append((track,))
+        if len(batch) == 50000:
+            conn.executemany("INSERT INTO tracks (track) VALUES (?)", batch)
+            batch = []
+    conn.executemany("INSERT INTO tracks (track) VALUES (?)", batch)
+    conn.commit()
+    conn.close()
+    return artists
+
+
+def catalogue_artists(path):
+    """Artists in an existing catalogue, most tracks first"""
+    conn = sqlite3.connect(path)
+    rows = conn.execute(
+        "SELECT substr(track, 1, instr(track, ' - ') - 1) AS artist, COUNT(*) AS n "
+        "FROM tracks WHERE instr(track, ' - ') > 0 GROUP BY artist ORDER BY n DESC LIMIT 5000"
+    ).fetchall()
+    conn.close()
+    return [artist for artist, _ in rows]
+
+
+def misspell(rng, text):
+    """Drop, double or swap one character"""
+    i = rng.randrange(1, len(text) - 1)
+    edit = rng.choice(["drop", "double", "swap"])
+    if edit == "drop":
+        return text[:i] + text[i + 1:]
+    if edit == "double":
+        return text[:i] + text[i] + text[i:]
+    return text[:i - 1] + text[i] + text[i - 1] + text[i + 1:]
+
+
+def keystroke_stream(artists, users=40, seed=7, misspelled=False):
+    """(session, query) pairs as users type searches one character at a time.
+
+    Targets follow artist popularity, sometimes with a title word added, so
+    popular prefixes repeat across users the way they do in production.
+    """
+    rng = random.Random(seed)
+    weights = zipf_weights(len(artists))
+    stream = []
+    for user in range(users):
+        for _ in range(3):
+            target = rng.choices(artists, cum_weights=weights)[0].lower()
+            if rng.random() < 0.4:
+                target += " " + rng.choice(TITLE_WORDS)
+            if misspelled and len(target) > 3:
+                target = misspell(rng, target)
+            for end in range(1, len(target) + 1):
+                if not target[end - 1].isspace():
+                    stream.append((f"user{user}", target[:end]))
+    return stream
+
+
+def load_stream(path):
+    """Recorded queries: plain lines or {"session", "q"} JSON lines"""
+    stream = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                stream.append((record.get("session", "recorded"), record["q"]))
+            else:
+                stream.append(("recorded", line))
+    return stream
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_worker(config_name, stream_path):
+    """Replay a stream through the app's search layer in this process"""
+    import psutil
+
+    config = CONFIGS[config_name]
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    with open(stream_path, encoding="utf-8") as f:
+        stream = [tuple(item) for item in json.load(f)]
+
+    started = time.perf_counter()
+    import app
+    app.build_search_index()
+    if config["call"] == "fuzzy":
+        app.fuzzy_catalogue.current()
+    startup = time.perf_counter() - started
+
+    page = app.SEARCH_PAGE_SIZE
+    if config["call"] == "fuzzy":
+        search = lambda session, q: app.fuzzy_catalogue.search(q)
+    elif config["call"] == "ranked":
+        search = lambda session, q: app.rank_tracks(q, page)
+    elif config.get("sessions"):
+        search = lambda session, q: app.search_tracks(q, None, page + 1, session)
+    else:
+        search = lambda session, q: app.search_tracks(q, None, page + 1)
+
+    latencies = []
+    found = 0
+    run_started = time.perf_counter()
+    for session, q in stream:
+        query_started = time.perf_counter()
+        results = search(session, q)
+        latencies.append((time.perf_counter() - query_started) * 1000)
+        found += bool(results)
+    elapsed = time.perf_counter() - run_started
+
+    latencies.sort()
+    return {
+        "queries": len(latencies),
+        "found": found,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(statistics.mean(latencies), 3),
+        "qps": round(len(latencies) / elapsed, 1),
+        "startup_s": round(startup, 3),
+        "rss_mb": round(process.memory_info().rss / 1e6, 1),
+        "rss_delta_mb": round((process.memory_info().rss - rss_before) / 1e6, 1),
+    }
+
+
+def run_config(config_name, db_path, stream_path):
+    """Run one config in a fresh process so memory and caches don't leak over"""
+    env = dict(os.environ, RADIO_DB=db_path, **CONFIGS[config_name]["env"])
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", config_name,
+         "--worker-stream", stream_path],
+        env=env, cwd=here, check=True, stdout=subprocess.PIPE, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def print_table(results, baseline=None, tolerance=0.1):
+    """Print results; with a baseline, flag p50/p95/p99 that got slower"""
+    header = (f"{'config':<12} {'queries':>8} {'found':>7} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'qps':>9} {'start s':>8} {'rss MB':>8}")
+    print(header)
+    print("-" * len(header))
+    regressions = []
+    for name, r in results.items():
+        print(f"{name:<12} {r['queries']:>8} {r['found']:>7} {r['p50_ms']:>8.2f} "
+              f"{r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['qps']:>9.1f} "
+              f"{r['startup_s']:>8.2f} {r['rss_mb']:>8.1f}")
+        old = (baseline or {}).get(name)
+        if not old:
+            continue
+        changes = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if old[key] > 0:
+                change = r[key] / old[key] - 1
+                changes.append(f"{key[:3]} {change:+.0%}")
+                if change > tolerance:
+                    regressions.append(f"{name} {key}: {old[key]} -> {r[key]}")
+        print(f"{'':<12} vs baseline: {', '.join(changes)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[8:]),
+    )
+    parser.add_argument("--tracks", type=int, default=100000,
+                        help="rows to generate (10k to 5M)")
+    parser.add_argument("--db", help="catalogue to use; generated here if missing and kept")
+    parser.add_argument("--generate-only", action="store_true")
+    parser.add_argument("--configs", default=",".join(DEFAULT_CONFIGS),
+                        help=f"comma-separated, from: {', '.join(CONFIGS)}")
+    parser.add_argument("--queries", help="recorded query stream to replay")
+    parser.add_argument("--users", type=int, default=40,
+                        help="simulated users typing searches")
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="slowdown vs --compare that counts as a regression")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-stream", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.worker_stream)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.abspath(args.db or os.path.join(tmp, "radio.db"))
+        if os.path.exists(db_path):
+            artists = catalogue_artists(db_path)
+        else:
+            print(f"Generating {args.tracks} tracks in {db_path}...")
+            started = time.perf_counter()
+            artists = generate_catalogue(db_path, args.tracks)
+            print(f"Generated in {time.perf_counter() - started:.1f}s")
+        if args.generate_only:
+            return
+
+        results = {}
+        for name in args.configs.split(","):
+            config = CONFIGS[name]
+            if args.queries:
+                stream = load_stream(args.queries)
+            else:
+                stream = keystroke_stream(artists, args.users,
+                                          misspelled=config.get("misspelled", False))
+            stream_path = os.path.join(tmp, f"stream-{len(results)}.json")
+            with open(stream_path, "w", encoding="utf-8") as f:
+                json.dump(stream, f)
+            print(f"Running {name} ({len(stream)} queries)...", flush=True)
+            results[name] = run_config(name, db_path, stream_path)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print()
+    regressions = print_table(results, baseline, args.tolerance)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import threading
+
+# Seconds between broadcasts; everything published in between goes out together
+TICK = float(os.environ.get("FASTHTML_BROADCAST_TICK", 0.1))
+# Broadcasts a client may fall behind by before it is disconnected
+QUEUE_SIZE = 32
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT = 15.0
+KEEP_ALIVE = ": keep-alive\n\n"
+
+
+def sse_event(event, html):
+    """One server-sent event carrying ``html`` (every line as a data line)"""
+    data = "\n".join(f"data: {line}" for line in html.splitlines() or [""])
+    return f"event: {event}\n{data}\n\n"
+
+
+class BroadcastHub:
+    """Fans updates out to every connected server-sent event stream.
+
+    ``publish()`` may be called from any thread. Once per tick the events
+    published since the last one are encoded once and queued for each
+    stream, so a burst of updates costs one write per client rather than
+    one per update. An idle stream is just a coroutine waiting on its
+    queue; no task runs per client between ticks.
+    """
+
+    def __init__(self, tick=TICK, queue_size=QUEUE_SIZE, heartbeat=HEARTBEAT):
+        self.tick = tick
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self._subscribers = {}  # queue -> client
+        self._pending = []  # (event, html, client)
+        self._lock = threading.Lock()
+        self._task = None
+        self.ticks = 0
+        self.dropped = 0
+
+    def publish(self, event, html, client=None, latest_only=False):
+        """Queue ``html`` as ``event`` for the next tick.
+
+        Streams opened with the same ``client`` skip it, since that page
+        already shows its own update. With ``latest_only`` an earlier
+        pending ``event`` is replaced instead of sent as well.
+        """
+        if not self._subscribers:
+            return
+        with self._lock:
+            if latest_only:
+                self._pending = [item for item in self._pending if item[0] != event]
+            self._pending.append((event, html, client))
+
+    async def stream(self, client=None):
+        """Server-sent events for one connection, until it closes"""
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers[queue] = client
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        try:
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    payload = KEEP_ALIVE
+                if payload is None:
+                    return
+                yield payload
+        finally:
+            self._subscribers.pop(queue, None)
+
+    async def _run(self):
+        while self._subscribers:
+            await asyncio.sleep(self.tick)
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if pending:
+                self._broadcast(pending)
+                self.ticks += 1
+
+    def _broadcast(self, pending):
+        # Events of the same name are joined, e.g. every new message in one event
+        def encode(skip_client=None):
+            joined = {}
+            for event, html, client in pending:
+                if client is None or client != skip_client:
+                    joined.setdefault(event, []).append(html)
+            return "".join(sse_event(event, "".join(parts)) for event, parts in joined.items())
+
+        everyone = encode()
+        authors = {client for _, _, client in pending if client is not None}
+        payloads = {client: encode(client) for client in authors}
+        for queue, client in list(self._subscribers.items()):
+            payload = payloads.get(client, everyone)
+            if not payload:
+                continue
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Too slow to keep up: end its stream, the browser reconnects
+                self.dropped += 1
+                self._subscribers.pop(queue, None)
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    def stats(self):
+        return {"streams": len(self._subscribers), "ticks": self.ticks, "dropped": self.dropped}
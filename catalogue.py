@@ -0,0 +1,342 @@
+import heapq
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from itertools import islice
+
+import db
+
+# How often (seconds) to look at radio.db's mtime for a newer catalogue
+RELOAD_CHECK_INTERVAL = float(os.environ.get("RADIO_CATALOGUE_CHECK_INTERVAL", 2))
+# Fuzzy search: share of the query's trigrams a track must contain, and
+# the most suggestions returned
+FUZZY_THRESHOLD = float(os.environ.get("RADIO_FUZZY_THRESHOLD", 0.5))
+FUZZY_LIMIT = int(os.environ.get("RADIO_FUZZY_LIMIT", 50))
+
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def _read_tracks(path):
+    """Yield distinct track names in sorted order from a read-only connection"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        # SQLite's default BINARY collation sorts UTF-8 bytewise, which is
+        # the same order Python uses for str, so row order = result order
+        cursor = conn.execute(
+            "SELECT DISTINCT track FROM tracks WHERE track IS NOT NULL ORDER BY track"
+        )
+        for (track,) in cursor:
+            yield str(track)
+    finally:
+        conn.close()
+
+
+class CatalogueSnapshot:
+    """All distinct track names packed into two byte buffers.
+
+    ``raw`` holds the UTF-8 names in sorted order separated by newlines and
+    ``lowered`` the same bytes with ASCII letters lowercased (matching
+    SQLite's LOWER()), so both share one offset array. Substring searches run
+    as ``bytes.find`` over the whole buffer instead of row by row.
+    """
+
+    def __init__(self, raw, lowered, offsets, mtime):
+        self.raw = raw
+        self.lowered = lowered
+        self.offsets = offsets  # start of each row, plus one past the end
+        self.mtime = mtime
+
+    @classmethod
+    def load(cls, path, mtime):
+        """Read the tracks table into a new snapshot"""
+        raw = bytearray()
+        lowered = bytearray()
+        offsets = array("q")
+        for track in _read_tracks(path):
+            encoded = track.encode("utf-8")
+            offsets.append(len(raw))
+            raw += encoded + b"\n"
+            lowered += encoded.replace(b"\n", b" ").lower() + b"\n"
+        offsets.append(len(raw))
+        return cls(bytes(raw), bytes(lowered), offsets, mtime)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def track(self, row):
+        return self.raw[self.offsets[row]:self.offsets[row + 1] - 1].decode("utf-8")
+
+    def first_row_after(self, after):
+        """Index of the first row sorting after ``after`` (keyset pagination)"""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.track(mid) <= after:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _matching_rows(self, words, row=0):
+        """Yield, in order, the rows from ``row`` on containing all words"""
+        needles = [word.encode("utf-8").lower() for word in words]
+        # Drive the scan with the longest word, usually the rarest one
+        needles.sort(key=len, reverse=True)
+        driver, others = needles[0], needles[1:]
+        buf, offsets = self.lowered, self.offsets
+
+        pos = buf.find(driver, offsets[row]) if row < len(self) else -1
+        while pos != -1:
+            row = bisect_right(offsets, pos) - 1
+            start, end = offsets[row], offsets[row + 1]
+            if all(buf.find(needle, start, end) != -1 for needle in others):
+                yield row
+            # Skip the rest of this row
+            pos = buf.find(driver, end)
+
+    def search(self, words, after=None, limit=None):
+        """Tracks containing all words as substrings, in sorted order"""
+        row = 0 if after is None else self.first_row_after(after)
+        rows = self._matching_rows(words, row)
+        if limit is not None:
+            rows = islice(rows, limit)
+        return [self.track(row) for row in rows]
+
+    def search_ranked(self, words, limit):
+        """Best ``limit`` tracks, ranked like track_search.search_ranked"""
+        phrase = " " + " ".join(words)
+        prefixes = [" " + word for word in words]
+
+        def rank(row):
+            spaced = " " + self.lowered[self.offsets[row]:self.offsets[row + 1] - 1].decode("utf-8")
+            if spaced == phrase:
+                tier = 3
+            elif phrase in spaced:
+                tier = 2
+            elif all(prefix in spaced for prefix in prefixes):
+                tier = 1
+            else:
+                tier = 0
+            return (-tier, len(spaced), row)
+
+        best = heapq.nsmallest(limit, (rank(row) for row in self._matching_rows(words)))
+        return [self.track(row) for _, _, row in best]
+
+    def memory_bytes(self):
+        return (len(self.raw) + len(self.lowered)
+                + self.offsets.itemsize * len(self.offsets))
+
+
+def trigrams(text):
+    """Set of padded, lowercased character trigrams of each word in text"""
+    grams = set()
+    for word in _WORD_RE.findall(text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """Inverted index from character trigrams to distinct track names.
+
+    Used for typo-tolerant search: a track scores by the share of the
+    query's trigrams it contains, with ties going to the track that has the
+    fewest other trigrams (the closer overall match).
+    """
+
+    def __init__(self, tracks, gram_counts, postings, mtime):
+        self.tracks = tracks
+        self.gram_counts = gram_counts  # number of trigrams per track
+        self.postings = postings  # trigram -> array of track ids
+        self.mtime = mtime
+
+    @classmethod
+    def load(cls, path, mtime):
+        tracks = []
+        gram_counts = array("H")
+        postings = {}
+        for track_id, track in enumerate(_read_tracks(path)):
+            grams = trigrams(track)
+            tracks.append(track)
+            gram_counts.append(min(len(grams), 0xFFFF))
+            for gram in grams:
+                ids = postings.get(gram)
+                if ids is None:
+                    ids = postings[gram] = array("i")
+                ids.append(track_id)
+        return cls(tracks, gram_counts, postings, mtime)
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def search(self, query, limit=FUZZY_LIMIT, threshold=FUZZY_THRESHOLD):
+        """Best matching tracks as ``(track, score)``, best first"""
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+        shared = Counter()
+        for gram in query_grams:
+            ids = self.postings.get(gram)
+            if ids is not None:
+                shared.update(ids)  # counted in C
+
+        needed = threshold * len(query_grams)
+        scored = (
+            (count / len(query_grams),
+             count / (len(query_grams) + self.gram_counts[track_id] - count),
+             -track_id)  # then alphabetical
+            for track_id, count in shared.items() if count >= needed
+        )
+        best = heapq.nlargest(limit, scored)
+        return [(self.tracks[-neg_id], round(score, 3))
+                for score, _, neg_id in best]
+
+    def memory_bytes(self):
+        return (sum(sys.getsizeof(track) for track in self.tracks)
+                + self.gram_counts.itemsize * len(self.gram_counts)
+                + sum(ids.itemsize * len(ids) for ids in self.postings.values()))
+
+
+class MemoryCatalogue:
+    """In-memory search engine over a snapshot of the tracks table.
+
+    ``snapshot_class`` builds the structure searched (CatalogueSnapshot for
+    substring search, TrigramIndex for fuzzy search). Reloads in a
+    background thread when radio.db (or its WAL file) gets a new mtime, and
+    swaps the snapshot in atomically once it is built, so searches keep
+    using the old one in the meantime. A different file at the path (a
+    switched symlink) is only moved to through ``prepare()``/``install()``,
+    together with the database connections.
+    """
+
+    def __init__(self, path=db.DB_PATH, snapshot_class=CatalogueSnapshot,
+                 check_interval=RELOAD_CHECK_INTERVAL):
+        self.path = path
+        self.snapshot_class = snapshot_class
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._identity = None  # file the snapshot was read from
+        self._lock = threading.Lock()
+        # Held while the first snapshot is built, so concurrent first
+        # searches wait for it instead of each building their own
+        self._first_load = threading.Lock()
+        self._loading = False
+        self._next_check = 0.0
+        self.reloads = 0
+        self.last_load_seconds = None
+
+    def _mtime(self):
+        mtimes = []
+        for path in (self.path, self.path + "-wal"):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                pass
+        return max(mtimes) if mtimes else None
+
+    def _load(self, mtime, identity):
+        started = time.perf_counter()
+        try:
+            snapshot = self.snapshot_class.load(self.path, mtime)
+            with self._lock:
+                # Dropped if install() moved to another file meanwhile
+                if self._snapshot is None or identity == self._identity:
+                    self._snapshot, self._identity = snapshot, identity
+                    self.reloads += 1
+                    self.last_load_seconds = round(time.perf_counter() - started, 3)
+        finally:
+            with self._lock:
+                self._loading = False
+
+    def load(self):
+        """Load the catalogue synchronously (used at startup)"""
+        with self._lock:
+            self._loading = True
+        self._load(self._mtime(), db.file_identity(self.path))
+
+    def start_loading(self):
+        """Build the first snapshot in a background thread (used at startup).
+
+        Searches arriving meanwhile wait for it rather than building another.
+        """
+        def load_once():
+            with self._first_load:
+                if self._snapshot is None:
+                    self.load()
+        threading.Thread(target=load_once, name="catalogue-load", daemon=True).start()
+
+    def ready(self):
+        """Whether a snapshot has been loaded, so searching won't wait for one"""
+        return self._snapshot is not None
+
+    def prepare(self):
+        """Build a snapshot of the file now at the path, without searching it.
+
+        Returns what ``install()`` takes, or None if nothing is loaded yet.
+        """
+        if self._snapshot is None:
+            return None
+        started = time.perf_counter()
+        identity = db.file_identity(self.path)
+        return self.snapshot_class.load(self.path, self._mtime()), identity, started
+
+    def install(self, prepared):
+        """Search the snapshot built by ``prepare()`` from now on"""
+        if prepared is None:
+            return
+        snapshot, identity, started = prepared
+        with self._lock:
+            self._snapshot, self._identity = snapshot, identity
+            self.reloads += 1
+            self.last_load_seconds = round(time.perf_counter() - started, 3)
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        mtime = self._mtime()
+        if self._snapshot is not None and mtime == self._snapshot.mtime:
+            return
+        identity = db.file_identity(self.path)
+        with self._lock:
+            if self._loading or identity != self._identity:
+                return
+            self._loading = True
+        threading.Thread(target=self._load, args=(mtime, identity), daemon=True).start()
+
+    def current(self):
+        """The snapshot to search, loading the catalogue on first use"""
+        if self._snapshot is None:
+            with self._first_load:
+                if self._snapshot is None:
+                    self.load()
+        else:
+            self._maybe_reload()
+        return self._snapshot
+
+    def snapshot_mtime(self):
+        """mtime the searched snapshot was built from (None before the first load)"""
+        snapshot = self._snapshot
+        return snapshot.mtime if snapshot is not None else None
+
+    def search(self, *args, **kwargs):
+        return self.current().search(*args, **kwargs)
+
+    def search_ranked(self, *args, **kwargs):
+        return self.current().search_ranked(*args, **kwargs)
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "tracks": len(snapshot) if snapshot else 0,
+            "memory_bytes": snapshot.memory_bytes() if snapshot else 0,
+            "reloads": self.reloads,
+            "last_load_seconds": self.last_load_seconds,
+        }
@@ -0,0 +1,193 @@
+import gzip
+import os
+import stat
+import zlib
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+# Responses smaller than this (bytes) are not worth compressing
+MINIMUM_SIZE = int(os.environ.get("RADIO_COMPRESS_MIN_SIZE", 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4  # fast enough for per-request use; precompress.py uses 11
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript",
+                      "application/xml", "image/svg+xml")
+# Event streams must reach the client message by message
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+
+def accepted_encodings(headers):
+    """Content codings the client accepts (ignoring q-values other than q=0)"""
+    accepted = set()
+    for item in headers.get("accept-encoding", "").split(","):
+        coding, _, params = item.strip().partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def choose_encoding(headers):
+    """Best encoding we can produce for the client, or None"""
+    accepted = accepted_encodings(headers)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _Encoder:
+    """Incremental brotli or gzip compressor"""
+
+    def __init__(self, encoding):
+        self.brotli = encoding == "br"
+        if self.brotli:
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            # wbits 31 = gzip container
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data):
+        """Compress ``data`` and flush, so the client can decode it right away"""
+        if self.brotli:
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data=b""):
+        if self.brotli:
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing text responses with brotli or gzip.
+
+    A complete response smaller than ``minimum_size`` is sent as is. Streamed
+    responses are compressed chunk by chunk and flushed after each one, so
+    rows still reach the browser as they are produced.
+    """
+
+    def __init__(self, app, minimum_size=MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        encoder = None
+
+        async def send_wrapper(message):
+            nonlocal start, encoder
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows what to do
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start is not None:
+                headers = MutableHeaders(scope=start)
+                if self._should_compress(headers, body, more_body):
+                    encoder = _Encoder(encoding)
+                    del headers["content-length"]
+                    headers["content-encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+                    if not more_body:
+                        body = encoder.finish(body)
+                        headers["content-length"] = str(len(body))
+                        await send(start)
+                        await send({"type": "http.response.body", "body": body})
+                        return
+                await send(start)
+                start = None
+
+            if encoder is None:
+                await send(message)
+            elif more_body:
+                await send({"type": "http.response.body", "body": encoder.chunk(body),
+                            "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": encoder.finish(body)})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _should_compress(self, headers, body, more_body):
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        if "content-encoding" in headers or content_type in UNCOMPRESSED_TYPES:
+            return False
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+        # Streams are compressed whatever the size of their first chunk
+        return more_body or len(body) >= self.minimum_size
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves ``name.br`` / ``name.gz`` (built by
+    precompress.py) instead of ``name`` when the client accepts that
+    encoding and the compressed copy is not older than the original.
+    """
+
+    ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+    async def get_response(self, path, scope):
+        response = None
+        if scope["method"] in ("GET", "HEAD") and path not in ("", "."):
+            response = await self._precompressed(path, scope)
+        if response is None:
+            response = await super().get_response(path, scope)
+        response.headers.add_vary_header("Accept-Encoding")
+        return response
+
+    async def _precompressed(self, path, scope):
+        accepted = accepted_encodings(Headers(scope=scope))
+        if not accepted & {encoding for encoding, _ in self.ENCODINGS}:
+            return None
+        _, original = await anyio.to_thread.run_sync(self.lookup_path, path)
+        if original is None or not stat.S_ISREG(original.st_mode):
+            return None
+        for encoding, suffix in self.ENCODINGS:
+            if encoding not in accepted:
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if (stat_result is None or not stat.S_ISREG(stat_result.st_mode)
+                    or stat_result.st_mtime < original.st_mtime):
+                continue
+            response = self.file_response(full_path, stat_result, scope)
+            # FileResponse guesses the type from "name.css.gz" as text/css
+            if response.status_code != 304:
+                response.headers["content-encoding"] = encoding
+            return response
+        return None
+
+
+def precompress_file(path, level=9):
+    """Write ``path``.gz (and ``path``.br with brotli installed); returns the paths written"""
+    with open(path, "rb") as f:
+        data = f.read()
+    written = []
+    with open(path + ".gz", "wb") as f:
+        # mtime=0 keeps the output identical between builds
+        f.write(gzip.compress(data, compresslevel=level, mtime=0))
+    written.append(path + ".gz")
+    if brotli is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+        written.append(path + ".br")
+    return written
@@ -0,0 +1,447 @@
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Database settings, overridable from the environment
+DB_PATH = os.environ.get("RADIO_DB", "radio.db")
+POOL_SIZE = int(os.environ.get("RADIO_DB_POOL_SIZE", 8))
+MMAP_SIZE = int(os.environ.get("RADIO_DB_MMAP_SIZE", 256 * 1024 * 1024))
+CACHE_SIZE = int(os.environ.get("RADIO_DB_CACHE_SIZE", -64 * 1024))  # negative = KiB
+WAL_MODE = os.environ.get("RADIO_DB_WAL", "1") != "0"
+# Open the catalogue read-only (set by serve.py for its worker processes)
+READ_ONLY = os.environ.get("RADIO_DB_READONLY", "0") == "1"
+# Threads running queries; keep it <= POOL_SIZE so workers rarely wait on the
+# pool. Streamed searches also hold connections between batches, but at most
+# RADIO_SEARCH_STREAM_CONNECTIONS of them (half the pool by default).
+QUERY_WORKERS = int(os.environ.get("RADIO_DB_WORKERS", POOL_SIZE))
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free in time"""
+
+
+class FileReplaced(sqlite3.OperationalError):
+    """Raised instead of opening a database file other than the one in use"""
+
+
+def file_fingerprint(path):
+    """Changes whenever the database file, or its WAL, is replaced or written.
+
+    Unlike a CatalogueVersion generation it is the same in every process.
+    """
+    parts = []
+    for name in (path, path + "-wal"):
+        try:
+            st = os.stat(name)
+        except OSError:
+            parts.append(None)
+            continue
+        parts.append((st.st_ino, st.st_mtime_ns, st.st_size))
+    return tuple(parts)
+
+
+def file_identity(path):
+    """(device, inode) of the file at ``path``, following symlinks; None if missing"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections.
+
+    Connections are handed out most-recently-used first so that a warm
+    connection (and its page cache) is reused whenever possible. A connection
+    that has been idle longer than ``health_check_interval`` seconds is pinged
+    before it is handed out and replaced if it turns out to be broken.
+
+    Connections are opened on the file ``path`` resolved to when the pool
+    was created (or last reopened), so switching a symlink to a new
+    catalogue only takes effect through ``reopen()``. Until then, new
+    connections are refused if another file was renamed over that one.
+    """
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, mmap_size=MMAP_SIZE,
+                 cache_size=CACHE_SIZE, wal=WAL_MODE, read_only=READ_ONLY,
+                 timeout=30.0, health_check_interval=30.0):
+        self.path = path
+        self.size = size
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.wal = wal
+        self.read_only = read_only
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+        # Connections to the current file; others are closed when released
+        self._target = os.path.realpath(path)
+        self._identity = file_identity(self._target)
+        self._current = set()
+
+    @property
+    def target(self):
+        """The file connections are currently opened on"""
+        return self._target
+
+    def _connect(self, target, identity):
+        """Open a new connection to ``target``, which must still be the file
+        ``identity`` was taken from, and apply the configured pragmas"""
+        if identity is not None and file_identity(target) != identity:
+            # Reading the new file together with the old one's WAL would
+            # return corrupt pages; stay on the connections already open
+            raise FileReplaced(f"{target} was replaced by another file; "
+                               "switch a symlink to the new file instead")
+        if self.read_only:
+            conn = sqlite3.connect(f"file:{target}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(target, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        if self.wal:
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.OperationalError:
+                pass  # read-only database: keep its current journal mode
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        return conn
+
+    def _is_healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created -= 1
+            self._current.discard(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self):
+        """Take a connection from the pool, opening one if below the limit"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            if self._closed:
+                raise PoolTimeout("Connection pool is closed")
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._created < self.size
+                    if can_open:
+                        self._created += 1
+                        target, identity = self._target, self._identity
+                if can_open:
+                    try:
+                        conn = self._connect(target, identity)
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                    with self._lock:
+                        if target == self._target:
+                            self._current.add(conn)
+                    return conn
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No database connection free after {self.timeout}s")
+                try:
+                    conn, last_used = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+
+            if (time.monotonic() - last_used > self.health_check_interval
+                    and not self._is_healthy(conn)):
+                self._discard(conn)
+                continue
+            return conn
+
+    def release(self, conn):
+        """Return a connection to the pool"""
+        if self._closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        with self._lock:
+            current = conn in self._current
+            if current:
+                self._idle.put((conn, time.monotonic()))
+        if not current:
+            self._discard(conn)
+
+    def reopen(self, path=None, warm=None):
+        """Switch the pool to a new database file without dropping requests.
+
+        ``path`` defaults to the pool's path, resolved again (for a symlink
+        that now points elsewhere). Connections to the new file are opened
+        and passed to ``warm`` first, then replace the idle ones in one step.
+        Requests already holding a connection finish on the old file, which
+        is closed when released, so the pool may briefly exceed its size.
+        """
+        target = os.path.realpath(path or self.path)
+        identity = file_identity(target)
+        if target == self._target and os.path.exists(target + "-wal"):
+            # The old file's WAL would be replayed into the new one
+            raise FileReplaced(f"{target} was replaced while its WAL file is in use; "
+                               "switch a symlink to the new file instead")
+        with self._lock:
+            count = max(1, min(self.size, self._created))
+        fresh = []
+        try:
+            for _ in range(count):
+                conn = self._connect(target, identity)
+                fresh.append(conn)
+                if warm is not None:
+                    warm(conn)
+        except Exception:
+            for conn in fresh:
+                conn.close()
+            raise
+
+        with self._lock:
+            stale = []
+            while True:
+                try:
+                    stale.append(self._idle.get_nowait()[0])
+                except queue.Empty:
+                    break
+            if path:
+                self.path = path
+            self._target = target
+            self._identity = identity
+            self._current = set(fresh)
+            self._created += len(fresh) - len(stale)
+            now = time.monotonic()
+            for conn in fresh:
+                self._idle.put((conn, now))
+        for conn in stale:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a ``with`` block"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Close all idle connections; busy ones are closed when released"""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        """Current pool usage"""
+        idle = self._idle.qsize()
+        return {"size": self.size, "open": self._created, "idle": idle,
+                "in_use": self._created - idle}
+
+
+class CatalogueVersion:
+    """Tracks changes to the database made by any connection or process.
+
+    ``PRAGMA data_version`` only changes when *another* connection commits,
+    so a dedicated connection that never writes sees every change. The
+    returned generation number increases each time a change is noticed.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._target = os.path.realpath(path)
+        self._identity = file_identity(self._target)
+        self._conn = None
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._generation = 0
+
+    def current(self):
+        """Return the generation number, bumping it if the data changed"""
+        with self._lock:
+            if self._conn is None and self._identity not in (None, file_identity(self._target)):
+                # Replaced by another file, which is not switched to until reopen()
+                return self._generation
+            try:
+                if self._conn is None:
+                    self._conn = sqlite3.connect(self._target, check_same_thread=False)
+                data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            except sqlite3.Error:
+                # data_version is only comparable within one connection, so
+                # reconnect next time and count this as a change
+                if self._conn is not None:
+                    self._conn.close()
+                self._conn = None
+                self._data_version = None
+                self._generation += 1
+                return self._generation
+            if self._data_version is not None and data_version != self._data_version:
+                self._generation += 1
+            self._data_version = data_version
+            return self._generation
+
+    def reopen(self):
+        """Follow ``path`` to a new file; always counts as a change"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._target = os.path.realpath(self.path)
+            self._identity = file_identity(self._target)
+            self._data_version = None
+            self._generation += 1
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class CatalogueWatcher:
+    """Calls ``on_replaced()`` from a background thread when the database
+    path points to a different file (a symlink switched to a new file).
+    Changes made inside the same file are left to CatalogueVersion.
+
+    A file ``on_replaced()`` failed on is tried again once it changes.
+    """
+
+    def __init__(self, on_replaced, path=DB_PATH, check_interval=2.0):
+        self.on_replaced = on_replaced
+        self.path = path
+        self.check_interval = check_interval
+        self._identity = file_identity(path)
+        self._failed = None  # fingerprint of the file the last reload failed on
+        self._stop = threading.Event()
+        self._thread = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_reload_seconds = None
+        self.last_error = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="radio-catalogue-watcher",
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            self.check()
+
+    def check(self):
+        """Reload if the file changed; returns True when a reload succeeded"""
+        identity = file_identity(self.path)
+        if identity is None or identity == self._identity:
+            return False
+        # A bad file is not retried in a loop, only after it changes
+        fingerprint = file_fingerprint(self.path)
+        if fingerprint == self._failed:
+            return False
+        started = time.perf_counter()
+        try:
+            self.on_replaced()
+        except Exception as e:
+            self.failures += 1
+            self._failed = fingerprint
+            self.last_error = f"{type(e).__name__}: {e}"
+            return False
+        self._identity = identity
+        self._failed = None
+        self.reloads += 1
+        self.last_reload_seconds = round(time.perf_counter() - started, 3)
+        self.last_error = None
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {"reloads": self.reloads, "failures": self.failures,
+                "last_reload_seconds": self.last_reload_seconds,
+                "last_error": self.last_error}
+
+
+class QueryExecutor:
+    """Runs blocking database calls on a bounded thread pool.
+
+    Keeps SQLite work off the asyncio event loop so a slow search cannot
+    stall other requests, and counts how many calls are waiting for a
+    free worker.
+    """
+
+    def __init__(self, max_workers=QUERY_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="radio-db")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._max_queued = 0
+
+    def _call(self, fn, args):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    def _on_done(self, future):
+        # Calls cancelled before a worker picked them up never reach _call
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def submit(self, fn, *args):
+        """Queue ``fn(*args)`` for a worker thread; returns its concurrent future"""
+        with self._lock:
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+        future = self._executor.submit(self._call, fn, args)
+        future.add_done_callback(self._on_done)
+        return future
+
+    async def run(self, fn, *args):
+        """Run ``fn(*args)`` on a worker thread and await its result"""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        """Current queue depth and worker usage"""
+        with self._lock:
+            return {"workers": self.max_workers, "queued": self._queued,
+                    "running": self._running, "completed": self._completed,
+                    "max_queued": self._max_queued}
@@ -2,6 +2,8 @@
 # pyright: reportUndefinedVariable=false
 from fasthtml.common import *
 import os
+import assets
+from render_cache import static_page
 
 # Initialize the application and router without default Pico CSS
 app, rt = fast_app(pico=False)
@@ -177,6 +179,7 @@ font_style = """
 """
 
 @rt('/')
+@static_page()  # the page never changes: build and serialise it once
 def get():
     return Titled(
         "Preview • Pico CSS",  # Page title
@@ -615,6 +618,10 @@ app.hdrs += (
     # Modal script
     Script(modal_js)
 )
+# Move the inline font style and scripts into fingerprinted files, so browsers
+# cache them for good instead of receiving them with every page
+app.hdrs = assets.externalize(app.hdrs)
+assets.mount_assets(app)
 
 # Get port from environment variable if set
 port = int(os.environ.get('FASTHTML_PORT', 5004))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Import CSV/JSONL playlists into radio.db and build its search indexes.
+
+Rows are staged in a temporary table, in large batched transactions with
+journaling off and no indexes in place, then copied into the tracks table in
+one transaction, deduplicated and sorted; the track index and the FTS5 index
+are built in one pass each. A file that fails to parse leaves the tracks as
+they were.
+Stop the server (or import into a new file) before running it.
+
+Usage:
+    python3 import_tracks.py PLAYLIST [PLAYLIST ...] [--db PATH] [--replace]
+
+CSV files need a "track" column, or "artist" and "title" columns; without a
+header the first column is the track. JSONL lines hold a string, or an
+object with "track" or "artist" and "title".
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from itertools import islice
+
+import db
+import track_search
+
+BATCH_SIZE = 50000
+TRACK_INDEX = "tracks_track_idx"
+
+
+def _track_from_fields(fields):
+    """Track name from a mapping with "track", or "artist" and "title" """
+    fields = {str(key).strip().lower(): value for key, value in fields.items() if key is not None}
+    track = fields.get("track")
+    if not track and fields.get("artist") and fields.get("title"):
+        track = f"{str(fields['artist']).strip()} - {str(fields['title']).strip()}"
+    return track
+
+
+def read_csv(f):
+    rows = csv.reader(f)
+    header = next(rows, None)
+    if header is None:
+        return
+    names = [name.strip().lower() for name in header]
+    if "track" in names or {"artist", "title"} <= set(names):
+        for row in rows:
+            yield _track_from_fields(dict(zip(names, row)))
+    else:
+        yield header[0]
+        for row in rows:
+            if row:
+                yield row[0]
+
+
+def read_jsonl(f):
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            raise ValueError(f"line {line_number}: not valid JSON") from None
+        yield item if isinstance(item, str) else _track_from_fields(item)
+
+
+READERS = {".csv": read_csv, ".jsonl": read_jsonl, ".ndjson": read_jsonl}
+
+
+def _reader(path):
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix not in READERS:
+        raise ValueError(f"{path}: unsupported file type (use .csv or .jsonl)")
+    if not os.path.isfile(path):
+        raise ValueError(f"{path}: no such file")
+    return READERS[suffix]
+
+
+def read_tracks(path):
+    """Track names in a playlist file, stripped, skipping blanks"""
+    reader = _reader(path)
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for track in reader(f):
+            if track and str(track).strip():
+                yield str(track).strip()
+
+
+def _batches(tracks, size):
+    tracks = iter(tracks)
+    while True:
+        batch = [(track,) for track in islice(tracks, size)]
+        if not batch:
+            return
+        yield batch
+
+
+def import_tracks(conn, paths, replace=False, batch_size=BATCH_SIZE, progress=None):
+    """Import the playlists into ``conn``; returns counts and timings.
+
+    Nothing in the main database changes until every file has been read: a
+    bad line leaves the existing tracks as they were.
+    """
+    for path in paths:
+        _reader(path)  # fail before reading anything
+    timings = {}
+    # Staging lives in the temp database, loaded with journaling off; the
+    # main database keeps its journal, so the final swap can roll back
+    conn.execute("PRAGMA temp_store=FILE")
+    conn.execute("PRAGMA temp.journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    try:
+        started = time.perf_counter()
+        conn.execute("CREATE TEMP TABLE import_staging (track TEXT)")
+        read = 0
+        for path in paths:
+            for batch in _batches(read_tracks(path), batch_size):
+                conn.execute("BEGIN")
+                conn.executemany("INSERT INTO temp.import_staging (track) VALUES (?)", batch)
+                conn.execute("COMMIT")
+                read += len(batch)
+                if progress:
+                    progress(read, time.perf_counter() - started)
+        timings["load"] = time.perf_counter() - started
+
+        # One transaction: replace the table (or drop its index and FTS
+        # triggers, so nothing is maintained row by row), then insert in
+        # track order, so the table and index pages are written sequentially.
+        # Without its triggers the FTS5 index is rebuilt below.
+        started = time.perf_counter()
+        conn.execute("BEGIN")
+        if replace:
+            conn.execute(f"DROP TABLE IF EXISTS {track_search.FTS_TABLE}")
+            conn.execute("DROP TABLE IF EXISTS tracks")
+        # An explicit key keeps the rowids the FTS5 index refers to stable across VACUUM
+        conn.execute("CREATE TABLE IF NOT EXISTS tracks (id INTEGER PRIMARY KEY, track TEXT)")
+        conn.execute(f"DROP INDEX IF EXISTS {TRACK_INDEX}")
+        for suffix in ("ai", "ad", "au"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {track_search.FTS_TABLE}_{suffix}")
+        before = conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+        conn.execute(
+            # NOT IN matches nothing if its list holds a NULL, so leave those out
+            "INSERT INTO tracks (track) SELECT DISTINCT track FROM temp.import_staging "
+            "WHERE track NOT IN (SELECT track FROM tracks WHERE track IS NOT NULL) ORDER BY track"
+        )
+        inserted = conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0] - before
+        conn.execute(f"CREATE INDEX {TRACK_INDEX} ON tracks (track)")
+        conn.execute("COMMIT")
+        timings["dedupe"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        fts = track_search.FTS_ENABLED and track_search.ensure_fts_index(conn)
+        conn.execute("PRAGMA optimize")
+        timings["index"] = time.perf_counter() - started
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.import_staging")
+        conn.execute("PRAGMA synchronous=FULL")
+
+    return {"read": read, "inserted": inserted, "duplicates": read - inserted,
+            "fts": bool(fts), "timings": timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("playlists", nargs="+", metavar="PLAYLIST")
+    parser.add_argument("--db", default=db.DB_PATH)
+    parser.add_argument("--replace", action="store_true",
+                        help="drop existing tracks instead of adding to them")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    def progress(rows, seconds):
+        print(f"\r{rows:,} rows read ({rows / seconds:,.0f} rows/s)", end="", file=sys.stderr)
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        result = import_tracks(conn, args.playlists, args.replace, args.batch_size, progress)
+    except (OSError, ValueError) as e:
+        sys.exit(f"\nImport failed: {e}")
+    finally:
+        conn.close()
+
+    timings = result["timings"]
+    total = sum(timings.values())
+    print(f"\nRead {result['read']:,} rows in {timings['load']:.1f}s "
+          f"({result['read'] / max(timings['load'], 1e-9):,.0f} rows/s)")
+    print(f"Added {result['inserted']:,} tracks, skipped {result['duplicates']:,} duplicates, "
+          f"built the track index ({timings['dedupe']:.1f}s)")
+    if result["fts"]:
+        print(f"Built the FTS5 index in {timings['index']:.1f}s")
+    else:
+        print("No FTS5 index (FTS5 unavailable or disabled)")
+    print(f"Total {total:.1f}s, {result['read'] / max(total, 1e-9):,.0f} rows/s into {args.db}")
+
+
+if __name__ == "__main__":
+    main()
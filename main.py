@@ -2,16 +2,66 @@
 # pyright: reportUndefinedVariable=false
 from fasthtml.common import *
 import os
+import secrets
+import broadcast
+import compression
+import metrics
+import state_store
+
+# Live updates go to every open page over server-sent events
+hub = broadcast.BroadcastHub()
+
+def broadcast_changes(counter, rows):
+    hub.publish("counter", f"Counter: {counter}", latest_only=True)
+    for _, body, client in rows:
+        hub.publish("messages", to_xml(P(body)), client)
+
+# Counter and messages live in a state store (SQLite by default, shared by
+# every worker); writes are buffered in memory and flushed in the background,
+# and each flush broadcasts what changed, including other workers' changes
+state = state_store.WriteBehindState(state_store.make_store(), on_change=broadcast_changes)
+
+# Timings exposed at /metrics
+HTTP_LATENCY = metrics.Histogram(
+    "fasthtml_http_request_duration_seconds", "HTTP request latency by route", label="route")
+HTTP_RESPONSE_SIZE = metrics.Histogram(
+    "fasthtml_http_response_size_bytes", "HTTP response body size by route",
+    buckets=metrics.SIZE_BUCKETS, label="route")
+# stats() keys that only ever grow, exported as Prometheus counters
+COUNTER_STATS = {"flushes", "failures", "ticks", "dropped"}
 
 # Initialize the application and router with both CSS options available
-app, rt = fast_app(pico=False)  # Disable default Pico CSS
+app, rt = fast_app(pico=False, on_shutdown=[state.close])  # Disable default Pico CSS
+# Inside the metrics middleware, so response sizes are what goes over the wire
+app.add_middleware(compression.CompressionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware, latency=HTTP_LATENCY, size=HTTP_RESPONSE_SIZE)
+# Serves the .br/.gz copies written by precompress.py when the browser takes
+# them; mounted ahead of FastHTML's catch-all static route
+app.routes.insert(0, Mount("/static", compression.PrecompressedStaticFiles(directory="static"),
+                           name="static"))
 
-# A simple counter to demonstrate state
-counter = 0
-messages = []
+def counter_view(value):
+    return Div(
+        # Also updated by "counter" events from the live stream
+        P(f"Counter: {value}", sse_swap="counter"),
+        Button("Increment", hx_post="/increment", hx_target="#counter", hx_swap="outerHTML"),
+        id="counter"
+    )
+
+def message_page(messages, before):
+    """Messages, preceded by a button that replaces itself with the ones before id `before`"""
+    page = [P(body) for _, body, _ in messages]
+    # Ids start at 1 and messages are never deleted, so before 1 there is nothing
+    if before > 1:
+        page.insert(0, Button("Older messages", hx_get=f"/messages?before={before}",
+                              hx_swap="outerHTML", class_="secondary outline"))
+    return page
 
 @rt('/')
 def get():
+    recent = state.recent_messages()
+    # Identifies this page, so the live stream skips messages it posted itself
+    client = secrets.token_urlsafe(8)
     return Titled(
         "FastHTML Demo",
         Div(
@@ -25,23 +75,31 @@ def get():
                 class_="theme-switcher"
             ),
             P('Hello World!', hx_get="/change"),
+            # One live stream per page feeds the sse-swap targets inside it
             Div(
-                P(f"Counter: {counter}"),
-                Button("Increment", hx_post="/increment", hx_target="#counter"),
-                id="counter"
-            ),
-            Div(
-                H2("Message Board"),
-                Form(
-                    Input(type="text", name="message", placeholder="Enter a message"),
-                    Button("Submit", type="submit"),
-                    hx_post="/add-message",
-                    hx_target="#messages"
-                ),
+                counter_view(state.counter()),
                 Div(
-                    [P(msg) for msg in messages],
-                    id="messages"
-                )
+                    H2("Message Board"),
+                    Form(
+                        Input(type="text", name="message", placeholder="Enter a message"),
+                        Hidden(name="client", value=client),
+                        Button("Submit", type="submit"),
+                        hx_post="/add-message",
+                        hx_target="#messages",
+                        # Only the new message comes back; it is appended to the list
+                        hx_swap="beforeend",
+                        hx_on__after_request="this.reset()"
+                    ),
+                    Div(
+                        *message_page(recent, state.oldest_id(recent)),
+                        id="messages",
+                        # Messages posted from other pages arrive as "messages" events
+                        sse_swap="messages",
+                        hx_swap="beforeend"
+                    )
+                ),
+                hx_ext="sse",
+                sse_connect=f"/events?client={client}"
             )
         )
     )
@@ -52,28 +110,38 @@ def get():
 
 @rt('/increment', methods=['POST'])
 def post():
-    global counter
-    counter += 1
-    return Div(
-        P(f"Counter: {counter}"),
-        Button("Increment", hx_post="/increment", hx_target="#counter"),
-        id="counter"
-    )
+    return counter_view(state.increment())
 
 @rt('/add-message', methods=['POST'])
-def post():
-    global messages
-    message = request.form.get('message', '').strip()
-    if message:
-        messages.append(message)
-    return Div(
-        [P(msg) for msg in messages],
-        id="messages"
-    )
+def post(message: str = '', client: str = ''):
+    message = message.strip()
+    if not message:
+        return ''
+    state.add_message(message, client or None)
+    return P(message)
+
+@rt('/events')
+async def get(client: str = ''):
+    return EventStream(hub.stream(client or None))
 
-@rt('/static/<path:path>')
-def get(path):
-    return send_from_directory('static', path)
+@rt('/messages')
+def get(before: int):
+    messages = state.older_messages(before)
+    return message_page(messages, messages[0][0] if messages else 1)
+
+@rt('/metrics')
+def get():
+    """Request timings plus state store and live stream numbers, in Prometheus text format"""
+    lines = HTTP_LATENCY.exposition() + HTTP_RESPONSE_SIZE.exposition()
+    for section, values in (("state", state.stats()), ("live", hub.stats())):
+        for key, value in values.items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            if key in COUNTER_STATS:
+                lines += metrics.sample(f"fasthtml_{section}_{key}_total", value, "counter")
+            else:
+                lines += metrics.sample(f"fasthtml_{section}_{key}", value)
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
 
 # Add CSS styling with custom headers
 app.hdrs += (
@@ -85,6 +153,8 @@ app.hdrs += (
     Link(rel="stylesheet", href="/static/style.css"),
     # Theme switcher script
     Script(src="/static/theme-switcher.js"),
+    # htmx extension for the live update stream
+    Script(src="https://cdn.jsdelivr.net/npm/htmx-ext-sse@2.2.2/sse.js"),
 )
 
 # Get port from environment variable if set
@@ -92,4 +162,6 @@ port = int(os.environ.get('FASTHTML_PORT', 5004))
 
 # Start the server
 print(f"Starting FastHTML server. Visit http://localhost:{port} to see your application.")
-serve(port=port) 
\ No newline at end of file
+# Open event streams never finish on their own; cut them off after a couple
+# of seconds on shutdown, so on_shutdown still runs and flushes the state
+serve(port=port, timeout_graceful_shutdown=2) 
\ No newline at end of file
@@ -0,0 +1,142 @@
+import threading
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds and size buckets in bytes
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """Prometheus-style histogram with fixed buckets.
+
+    Each thread records into its own preallocated counters, so observing
+    never takes a lock; the shards are only summed when scraped.
+    """
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, label=None):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def observe(self, value, label_value=""):
+        shard = self._shard()
+        counts = shard.get(label_value)
+        if counts is None:
+            # One slot per bucket, then +Inf, then the running sum
+            counts = shard[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def time(self, label_value=""):
+        """Context manager observing the duration of its block"""
+        return _Timer(self, label_value)
+
+    def collect(self):
+        """Merged counts per label value"""
+        with self._shards_lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            for label_value, counts in list(shard.items()):
+                total = merged.setdefault(label_value, [0] * len(counts[:-1]) + [0.0])
+                for i, count in enumerate(counts):
+                    total[i] += count
+        return merged
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_value, counts in sorted(self.collect().items()):
+            labels = f'{self.label}="{_escape(label_value)}",' if self.label else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+            suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {counts[-1]}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, label_value):
+        self.histogram = histogram
+        self.label_value = label_value
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, self.label_value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def sample(name, value, kind="gauge", help=""):
+    """Exposition lines for a single gauge or counter value"""
+    return [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request and sizing its response.
+
+    Requests are labelled by route template ("/search", "/static") rather
+    than raw path to keep the number of series bounded.
+    """
+
+    def __init__(self, app, latency, size):
+        self.app = app
+        self.latency = latency
+        self.size = size
+        self._paths = {}  # endpoint -> route path, for plain Starlette routes
+
+    def _route_path(self, scope):
+        route = scope.get("route")  # set by FastAPI
+        if route is not None:
+            return route.path
+        # Starlette (and FastHTML) only record the endpoint
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return None
+        if endpoint not in self._paths:
+            self._paths[endpoint] = next(
+                (route.path for route in getattr(scope.get("app"), "routes", ())
+                 if getattr(route, "endpoint", None) is endpoint), None)
+        return self._paths[endpoint]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        sent = [0]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.body":
+                sent[0] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Routes record themselves in the scope; mounts only extend root_path
+            route = self._route_path(scope)
+            label = f'{scope["method"]} {route or scope.get("root_path") or "unmatched"}'
+            self.latency.observe(time.perf_counter() - started, label)
+            self.size.observe(sent[0], label)
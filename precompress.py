@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Write .gz (and .br, with brotli installed) copies of the static files.
+
+The /static mounts of app.py (css/) and main.py (static/) serve these instead of compressing on every request.
+Run it again after changing a file: a copy older than its original is ignored.
+
+Usage:
+    python3 precompress.py [DIRECTORY ...] [--force]
+"""
+import argparse
+import os
+
+import compression
+
+DIRECTORIES = ("css", "static")
+EXTENSIONS = (".css", ".js", ".html", ".svg", ".json", ".txt", ".xml")
+# Files smaller than this gain nothing from compression
+MINIMUM_SIZE = 256
+
+
+def static_files(directories):
+    for directory in directories:
+        for root, _, names in os.walk(directory):
+            for name in sorted(names):
+                if name.lower().endswith(EXTENSIONS):
+                    yield os.path.join(root, name)
+
+
+def is_fresh(path, copy):
+    return os.path.exists(copy) and os.path.getmtime(copy) >= os.path.getmtime(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directories", nargs="*", default=DIRECTORIES, metavar="DIRECTORY")
+    parser.add_argument("--force", action="store_true", help="rewrite copies that are up to date")
+    args = parser.parse_args()
+
+    suffixes = (".gz", ".br") if compression.brotli is not None else (".gz",)
+    for path in static_files(args.directories):
+        size = os.path.getsize(path)
+        if size < MINIMUM_SIZE:
+            continue
+        if not args.force and all(is_fresh(path, path + suffix) for suffix in suffixes):
+            continue
+        sizes = ", ".join(f"{os.path.splitext(copy)[1]} {os.path.getsize(copy):,}"
+                          for copy in compression.precompress_file(path))
+        print(f"{path}: {size:,} bytes -> {sizes}")
+    if compression.brotli is None:
+        print("brotli is not installed; wrote gzip copies only (pip install brotli)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+
+from fasthtml.common import FtResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Browsers keep the page but check its ETag before reusing it
+CACHE_CONTROL = "no-cache"
+# Rendered variants kept per route (full page / htmx fragment, URL, key)
+MAX_ENTRIES = 128
+
+
+def make_etag(body):
+    return f'W/"{hashlib.sha256(body).hexdigest()[:20]}"'
+
+
+def etag_matches(request, etag):
+    header = request.headers.get("if-none-match", "")
+    return header.strip() == "*" or etag in (tag.strip() for tag in header.split(","))
+
+
+def static_page(key=None, cache_control=CACHE_CONTROL, max_entries=MAX_ENTRIES):
+    """Route decorator for FastHTML pages whose output does not change.
+
+    The handler runs, and its FT tree is serialised, once per cache entry;
+    later requests get the stored bytes with an ETag, or 304 Not Modified.
+    Entries are per URL (FastHTML puts it in the canonical link), per full
+    page or htmx fragment, and per ``key(request)`` if given. The handler
+    takes no arguments, or just the request. Apply it below ``@rt``::
+
+        @rt('/')
+        @static_page()
+        def get(): ...
+
+    The cache lives as long as the decorated function, so reloading the code
+    (uvicorn --reload, or re-importing the module) starts an empty one.
+    """
+    def decorator(f):
+        takes_request = bool(inspect.signature(f).parameters)
+        cache = OrderedDict()  # cache key -> (body, headers, etag)
+        lock = threading.Lock()
+        stats = {"hits": 0, "misses": 0}
+
+        def render(request):
+            content = f(request) if takes_request else f()
+            response = FtResponse(content).__response__(request)
+            headers = {name: value for name, value in response.headers.items()
+                       if name != "content-length"}
+            return response.body, headers, make_etag(response.body)
+
+        async def page(req: Request):
+            fragment = "hx-request" in req.headers and "hx-history-restore-request" not in req.headers
+            cache_key = (str(req.url), fragment, key(req) if key else None)
+            with lock:
+                entry = cache.get(cache_key)
+                if entry is not None:
+                    cache.move_to_end(cache_key)
+                    stats["hits"] += 1
+            if entry is None:
+                entry = await run_in_threadpool(render, req)
+                with lock:
+                    cache[cache_key] = entry
+                    while len(cache) > max_entries:
+                        cache.popitem(last=False)
+                    stats["misses"] += 1
+            body, headers, etag = entry
+            validators = {"etag": etag, "cache-control": cache_control}
+            if etag_matches(req, etag):
+                return Response(status_code=304, headers={**validators, "vary": headers.get("vary", "")})
+            return Response(body, headers={**headers, **validators})
+
+        def cache_clear():
+            with lock:
+                cache.clear()
+
+        # FastHTML picks the HTTP method from the function name (get, post...)
+        page.__name__, page.__qualname__, page.__doc__ = f.__name__, f.__qualname__, f.__doc__
+        page.render = f
+        page.cache_clear = cache_clear
+        page.cache_stats = lambda: {**stats, "entries": len(cache)}
+        return page
+    return decorator
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Production server: app.py in several worker processes on one port.
+
+A supervisor process prepares the catalogue once (builds the FTS5 index),
+then starts the workers. Each worker opens radio.db read-only and
+memory-maps it, so all workers share one copy of the catalogue in the OS
+page cache. With SO_REUSEPORT the supervisor opens one listening socket per
+worker and the kernel spreads connections across them; otherwise the
+workers share a single socket. Either way the sockets belong to the
+supervisor, and a replacement worker takes over its predecessor's, so
+connections waiting to be accepted survive reloads and restarts.
+
+Signals to the supervisor:
+    HUP          start a fresh set of workers (reloading the code), then
+                 stop the old ones once the new ones are serving
+    TERM / INT   stop accepting connections, finish in-flight requests, exit
+
+Usage:
+    python3 serve.py [--workers N] [--host HOST] [--port PORT] [--no-reuse-port]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import time
+
+import db
+import track_search
+
+WORKERS = int(os.environ.get("RADIO_WORKERS", os.cpu_count() or 1))
+HOST = os.environ.get("RADIO_HOST", "0.0.0.0")
+PORT = int(os.environ.get("RADIO_PORT", 5001))
+REUSE_PORT = os.environ.get("RADIO_REUSE_PORT", "1") == "1" and hasattr(socket, "SO_REUSEPORT")
+# Seconds a stopping worker gets to finish its in-flight requests
+GRACEFUL_TIMEOUT = float(os.environ.get("RADIO_GRACEFUL_TIMEOUT", 30))
+# Seconds a new worker gets to start serving before a reload is abandoned
+STARTUP_TIMEOUT = 60.0
+# Seconds a stopping worker waits, after it stops accepting, before closing
+# connections that have not sent a request yet
+ACCEPT_DRAIN = 0.5
+
+
+def log(message):
+    print(f"[supervisor {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+def bind_socket(host, port, reuse_port):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def prepare_catalogue(path=db.DB_PATH):
+    """Build the search index once, so read-only workers find it ready.
+
+    Also sizes the memory map to cover the whole file.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        fts = track_search.build_search_index(conn)
+    finally:
+        conn.close()
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    os.environ["RADIO_DB_MMAP_SIZE"] = str(max(db.MMAP_SIZE, size + (64 << 20)))
+    os.environ.setdefault("RADIO_DB_READONLY", "1")
+    # Any worker may serve the next request of a session
+    os.environ.setdefault("RADIO_SESSION_STORE", "sqlite")
+    return fts
+
+
+def run_worker(sock, ready):
+    """Worker process: import the app and serve it on sock until told to stop"""
+    import uvicorn
+
+    from app import app
+
+    class Server(uvicorn.Server):
+        async def shutdown(self, sockets=None):
+            # uvicorn closes connections with no request in progress at once,
+            # including ones accepted a moment ago whose request is still
+            # unread; let those arrive first
+            for listener in self.servers:
+                listener.close()
+            await asyncio.sleep(ACCEPT_DRAIN)
+            await super().shutdown(sockets)
+
+    server = Server(uvicorn.Config(app, timeout_graceful_shutdown=GRACEFUL_TIMEOUT))
+
+    async def serve():
+        task = asyncio.create_task(server.serve(sockets=[sock]))
+        while not server.started and not task.done():
+            await asyncio.sleep(0.05)
+        if server.started:
+            try:
+                ready.send(True)
+            except OSError:
+                pass  # the supervisor stopped waiting for this worker
+        ready.close()
+        await task
+
+    asyncio.run(serve())
+
+
+class Supervisor:
+    """Starts, restarts and reloads the worker processes"""
+
+    def __init__(self, workers=WORKERS, host=HOST, port=PORT, reuse_port=REUSE_PORT):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port
+        # Spawned workers import everything afresh, so a reload picks up new code
+        self._context = multiprocessing.get_context("spawn")
+        self._sockets = []  # listening socket of each worker slot
+        self._active = []  # (process, ready pipe) of each worker slot
+        self._retiring = []
+        self._reload = False
+        self._stop = False
+
+    def _spawn(self, sock):
+        ready, ready_writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=run_worker, name="radio-worker", args=(sock, ready_writer),
+        )
+        process.start()
+        ready_writer.close()
+        return process, ready
+
+    def _wait_ready(self, workers):
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        try:
+            for process, ready in workers:
+                while not ready.poll(0.1):
+                    if not process.is_alive() or time.monotonic() > deadline or self._stop:
+                        return False
+                if not ready.recv():
+                    return False
+        except EOFError:
+            return False  # the worker exited before it started serving
+        finally:
+            for _, ready in workers:
+                ready.close()
+        return True
+
+    def _start_generation(self):
+        """Start a full set of workers; returns them once all are serving"""
+        workers = [self._spawn(sock) for sock in self._sockets]
+        if self._wait_ready(workers):
+            return workers
+        for process, _ in workers:
+            process.terminate()
+        for process, _ in workers:
+            process.join(GRACEFUL_TIMEOUT)
+        return None
+
+    def _retire(self, workers):
+        for process, ready in workers:
+            process.terminate()  # SIGTERM: uvicorn finishes in-flight requests
+            ready.close()
+        self._retiring += [(process, time.monotonic() + GRACEFUL_TIMEOUT) for process, _ in workers]
+
+    def _reap(self):
+        for process, deadline in list(self._retiring):
+            if not process.is_alive():
+                process.join()
+                self._retiring.remove((process, deadline))
+            elif time.monotonic() > deadline:
+                process.kill()
+        for slot, (process, ready) in enumerate(self._active):
+            # A restarted worker's pipe, closed once it reports in or exits
+            if not ready.closed and ready.poll():
+                ready.close()
+            if not process.is_alive() and not self._stop:
+                log(f"worker {process.pid} exited with {process.exitcode}, restarting")
+                ready.close()
+                self._active[slot] = self._spawn(self._sockets[slot])
+
+    def _on_signal(self, signum, frame):
+        if signum == signal.SIGHUP:
+            self._reload = True
+        else:
+            self._stop = True
+
+    def run(self):
+        prepare_catalogue()
+        if self.reuse_port:
+            self._sockets = [bind_socket(self.host, self.port, reuse_port=True)
+                             for _ in range(self.workers)]
+        else:
+            self._sockets = [bind_socket(self.host, self.port, reuse_port=False)] * self.workers
+        for signum in (signal.SIGTERM, signal.SIGINT, getattr(signal, "SIGHUP", None)):
+            if signum is not None:
+                signal.signal(signum, self._on_signal)
+
+        self._active = self._start_generation()
+        if self._active is None:
+            log("workers failed to start")
+            return 1
+        mode = "SO_REUSEPORT" if self.reuse_port else "shared socket"
+        log(f"{self.workers} workers serving http://{self.host}:{self.port} ({mode})")
+
+        while not self._stop:
+            if self._reload:
+                self._reload = False
+                log("reloading workers")
+                prepare_catalogue()
+                fresh = self._start_generation()
+                if fresh is None:
+                    log("new workers failed to start; keeping the old ones")
+                else:
+                    self._retire(self._active)
+                    self._active = fresh
+                    log("reload complete")
+            self._reap()
+            time.sleep(0.2)
+
+        log("shutting down")
+        self._retire(self._active)
+        self._active = []
+        while self._retiring:
+            self._reap()
+            time.sleep(0.1)
+        return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--no-reuse-port", dest="reuse_port", action="store_false",
+                        default=REUSE_PORT, help="share one listening socket instead")
+    args = parser.parse_args()
+    sys.exit(Supervisor(args.workers, args.host, args.port, args.reuse_port).run())
+
+
+if __name__ == "__main__":
+    main()
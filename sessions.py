@@ -0,0 +1,210 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import HTTPConnection
+
+# "memory" keeps sessions in the process; "sqlite" shares them between workers
+SESSION_STORE = os.environ.get("RADIO_SESSION_STORE", "memory")
+SESSION_DB = os.environ.get("RADIO_SESSION_DB", "sessions.db")
+SESSION_TTL = float(os.environ.get("RADIO_SESSION_TTL", 14 * 24 * 3600))
+MAX_SESSIONS = int(os.environ.get("RADIO_SESSION_MAX", 100000))
+
+
+class MemorySessionStore:
+    """Sessions in a dict, least recently used evicted first"""
+
+    backend = "memory"
+
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # id -> (data, expires)
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        """(data, expires) for a live session, or None"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return entry
+
+    def save(self, session_id, data):
+        with self._lock:
+            self._sessions[session_id] = (data, time.time() + self.ttl)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def touch(self, session_id):
+        entry = self.load(session_id)
+        if entry is not None:
+            self.save(session_id, entry[0])
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        return {"backend": self.backend, "sessions": len(self._sessions)}
+
+    def close(self):
+        pass
+
+
+class SQLiteSessionStore:
+    """Sessions in an SQLite table, shared by every worker process"""
+
+    backend = "sqlite"
+
+    def __init__(self, path=SESSION_DB, ttl=SESSION_TTL, prune_every=1000):
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(id TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL) WITHOUT ROWID"
+        )
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, expires FROM sessions WHERE id = ? AND expires >= ?",
+                (session_id, time.time()),
+            ).fetchone()
+        return None if row is None else (json.loads(row[0]), row[1])
+
+    def save(self, session_id, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)",
+                (session_id, json.dumps(data), time.time() + self.ttl),
+            )
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._conn.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),))
+
+    def touch(self, session_id):
+        with self._lock:
+            self._conn.execute("UPDATE sessions SET expires = ? WHERE id = ?",
+                               (time.time() + self.ttl, session_id))
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def stats(self):
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"backend": self.backend, "sessions": count}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def make_store(backend=SESSION_STORE):
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"Unknown session store {backend!r} (use 'memory' or 'sqlite')")
+
+
+def _private(headers):
+    """Response headers with Cache-Control made ``private``.
+
+    A response setting the session cookie must never be stored by a shared
+    cache, which would hand the session id to other users.
+    """
+    directives = []
+    rest = []
+    for name, value in headers:
+        if name.lower() == b"cache-control":
+            directives += [d.strip() for d in value.decode("latin-1").split(",") if d.strip()]
+        else:
+            rest.append((name, value))
+    directives = [d for d in directives if d.lower() not in ("public", "private")]
+    value = ", ".join(["private"] + directives)
+    return rest + [(b"cache-control", value.encode("latin-1"))]
+
+
+class ServerSessionMiddleware:
+    """ASGI middleware providing ``request.session`` from a server-side store.
+
+    The cookie only carries a random session id, so requests neither decode
+    nor sign the session data; it is written back only when it changed, or
+    when more than half of its lifetime has passed. Calls to a store that
+    does I/O run in the thread pool, off the event loop.
+    """
+
+    def __init__(self, app, store, cookie_name="session", same_site="lax", https_only=False):
+        self.app = app
+        self.store = store
+        self.cookie_name = cookie_name
+        self.flags = f"; path=/; httponly; samesite={same_site}" + ("; secure" if https_only else "")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        session_id = HTTPConnection(scope).cookies.get(self.cookie_name)
+        entry = await self._call(self.store.load, session_id) if session_id else None
+        if entry is None:
+            data, expires = {}, None
+        else:
+            data, expires = entry
+        scope["session"] = dict(data)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                cookie = await self._commit(session_id, data, expires, scope["session"])
+                if cookie is not None:
+                    message["headers"] = _private(message.get("headers", [])) + [
+                        (b"set-cookie", cookie.encode("latin-1"))
+                    ]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _call(self, fn, *args):
+        # The memory store only touches a dict; anything else may block on disk
+        if self.store.backend == "memory":
+            return fn(*args)
+        return await run_in_threadpool(fn, *args)
+
+    async def _commit(self, session_id, original, expires, session):
+        """Persist the session; returns a Set-Cookie value when the cookie changes"""
+        if not session:
+            if expires is not None:
+                await self._call(self.store.delete, session_id)
+            if session_id:
+                return f"{self.cookie_name}=null{self.flags}; Max-Age=0"
+            return None
+        max_age = int(self.store.ttl)
+        if expires is None:
+            session_id = secrets.token_urlsafe(16)
+            await self._call(self.store.save, session_id, session)
+        elif session != original:
+            await self._call(self.store.save, session_id, session)
+        elif expires - time.time() < self.store.ttl / 2:
+            await self._call(self.store.touch, session_id)
+        else:
+            return None
+        return f"{self.cookie_name}={session_id}{self.flags}; Max-Age={max_age}"
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Slow search query log, and a report of the worst query shapes in it.
+
+Usage:
+    python3 slow_log.py [LOGFILE] [--top N] [--sort total|max|count]
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import statistics
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+# Searches slower than this (milliseconds) are logged; negative disables logging
+SLOW_QUERY_MS = float(os.environ.get("RADIO_SLOW_QUERY_MS", 100))
+SLOW_QUERY_LOG = os.environ.get("RADIO_SLOW_QUERY_LOG", "slow_queries.log")
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+
+
+def query_shape(sql):
+    """The SQL with whitespace collapsed; parameters are already placeholders"""
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+class SlowQueryLog:
+    """Writes searches over a time threshold, with their query plan, to a
+    rotating log file of JSON lines.
+    """
+
+    def __init__(self, path=SLOW_QUERY_LOG, threshold_ms=SLOW_QUERY_MS,
+                 max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._logger = None
+        self._lock = threading.Lock()
+        self.logged = 0
+
+    def _get_logger(self):
+        # The file is only created once there is something to write
+        with self._lock:
+            if self._logger is None:
+                logger = logging.getLogger(f"radio.slow_queries.{id(self)}")
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+                handler = RotatingFileHandler(self.path, maxBytes=self.max_bytes,
+                                              backupCount=self.backups, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+                self._logger = logger
+            return self._logger
+
+    def record(self, conn, sql, params, seconds, query, words, rows):
+        """Log the query if it took longer than the threshold"""
+        elapsed_ms = seconds * 1000
+        if self.threshold_ms < 0 or elapsed_ms < self.threshold_ms:
+            return
+        try:
+            plan = [
+                detail for _, _, _, detail in
+                conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            ]
+        except sqlite3.Error as e:
+            plan = [f"unavailable: {e}"]
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "ms": round(elapsed_ms, 2),
+            "query": query,
+            "words": len(words),
+            "rows": rows,
+            "shape": query_shape(sql),
+            "plan": plan,
+        }
+        self._get_logger().info(json.dumps(entry, ensure_ascii=False))
+        self.logged += 1
+
+    def stats(self):
+        return {"threshold_ms": self.threshold_ms, "logged": self.logged}
+
+
+def read_entries(path):
+    """Entries from the log and its rotated backups, oldest file first"""
+    paths = [f"{path}.{i}" for i in range(LOG_BACKUPS, 0, -1)] + [path]
+    for log_path in paths:
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def summarize(entries):
+    """Per-shape statistics, keyed by shape"""
+    shapes = {}
+    for entry in entries:
+        shapes.setdefault(entry["shape"], []).append(entry)
+    summary = []
+    for shape, group in shapes.items():
+        times = [entry["ms"] for entry in group]
+        slowest = max(group, key=lambda entry: entry["ms"])
+        summary.append({
+            "shape": shape,
+            "count": len(group),
+            "total_ms": sum(times),
+            "median_ms": statistics.median(times),
+            "max_ms": max(times),
+            "avg_rows": sum(entry["rows"] for entry in group) / len(group),
+            "words": sorted({entry["words"] for entry in group}),
+            "slowest": slowest,
+        })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("log", nargs="?", default=SLOW_QUERY_LOG)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--sort", choices=["total", "max", "count"], default="total")
+    args = parser.parse_args()
+
+    summary = summarize(read_entries(args.log))
+    if not summary:
+        print(f"No slow queries in {args.log}")
+        return
+    key = {"total": "total_ms", "max": "max_ms", "count": "count"}[args.sort]
+    summary.sort(key=lambda shape: shape[key], reverse=True)
+    for rank, shape in enumerate(summary[:args.top], 1):
+        slowest = shape["slowest"]
+        print(f"#{rank}  {shape['count']} queries, total {shape['total_ms']:.0f} ms, "
+              f"median {shape['median_ms']:.1f} ms, max {shape['max_ms']:.1f} ms, "
+              f"avg {shape['avg_rows']:.0f} rows, words {shape['words']}")
+        print(f"    {shape['shape']}")
+        print(f"    slowest: {slowest['query']!r} ({slowest['ms']} ms, {slowest['rows']} rows)")
+        for step in slowest["plan"]:
+            print(f"      {step}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# "sqlite" keeps the counter and messages on disk, shared by every worker
+# process; "memory" keeps them in the process and loses them on restart
+STATE_BACKEND = os.environ.get("FASTHTML_STATE_BACKEND", "sqlite")
+STATE_DB = os.environ.get("FASTHTML_STATE_DB", "state.db")
+# Seconds writes are buffered in memory before they reach the backend;
+# 0 writes every change through immediately
+FLUSH_INTERVAL = float(os.environ.get("FASTHTML_STATE_FLUSH_INTERVAL", 0.1))
+# Newest messages kept in memory; older ones are read from the store a page at a time
+RECENT_MESSAGES = int(os.environ.get("FASTHTML_RECENT_MESSAGES", 50))
+COUNTER = "counter"
+
+
+class MemoryStateStore:
+    """Counter and messages held in the process"""
+
+    backend = "memory"
+
+    def __init__(self):
+        self._counter = 0
+        self._messages = []  # (id, body, client)
+        self._lock = threading.Lock()
+
+    def apply(self, increment=0, messages=(), after=0, limit=RECENT_MESSAGES):
+        """Add ``increment`` to the counter and append ``messages`` (body,
+        client) in one step.
+
+        Returns the new counter value and the newest ``limit`` messages with
+        an id above ``after``, as (id, body, client) tuples, oldest first.
+        ``client`` identifies the page that posted the message, if known.
+        """
+        with self._lock:
+            self._counter += increment
+            for body, client in messages:
+                self._messages.append((len(self._messages) + 1, body, client))
+            return self._counter, self._messages[max(after, len(self._messages) - limit):]
+
+    def messages_before(self, before, limit):
+        """The ``limit`` messages preceding id ``before``, oldest first"""
+        with self._lock:
+            return self._messages[max(0, before - 1 - limit):max(0, before - 1)]
+
+    def stats(self):
+        return {"backend": self.backend, "counter": self._counter, "messages": len(self._messages)}
+
+    def close(self):
+        pass
+
+
+class SQLiteStateStore:
+    """Counter and append-only message table in an SQLite file (WAL mode)"""
+
+    backend = "sqlite"
+
+    def __init__(self, path=STATE_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages "
+            "(id INTEGER PRIMARY KEY, body TEXT NOT NULL, created REAL NOT NULL, client TEXT)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(messages)")]
+        if "client" not in columns:
+            self._conn.execute("ALTER TABLE messages ADD COLUMN client TEXT")
+        self._conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)", (COUNTER,))
+
+    def apply(self, increment=0, messages=(), after=0, limit=RECENT_MESSAGES):
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so concurrent writers
+            # queue on busy_timeout instead of failing to upgrade a read lock.
+            # With nothing to write (an idle flush) a deferred transaction
+            # only reads, so it never waits on or blocks other writers.
+            self._conn.execute("BEGIN IMMEDIATE" if increment or messages else "BEGIN")
+            try:
+                if increment:
+                    # Atomic read-modify-write, whatever other processes do
+                    counter = self._conn.execute(
+                        "UPDATE counters SET value = value + ? WHERE name = ? RETURNING value",
+                        (increment, COUNTER),
+                    ).fetchone()[0]
+                else:
+                    counter = self._conn.execute(
+                        "SELECT value FROM counters WHERE name = ?", (COUNTER,)
+                    ).fetchone()[0]
+                if messages:
+                    now = time.time()
+                    self._conn.executemany(
+                        "INSERT INTO messages (body, created, client) VALUES (?, ?, ?)",
+                        [(body, now, client) for body, client in messages],
+                    )
+                rows = self._conn.execute(
+                    "SELECT id, body, client FROM messages WHERE id > ? ORDER BY id DESC LIMIT ?",
+                    (after, limit),
+                ).fetchall()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return counter, rows[::-1]
+
+    def messages_before(self, before, limit):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, body, client FROM messages WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (before, limit),
+            ).fetchall()
+        return rows[::-1]
+
+    def stats(self):
+        with self._lock:
+            counter = self._conn.execute("SELECT value FROM counters WHERE name = ?",
+                                         (COUNTER,)).fetchone()[0]
+            count = self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return {"backend": self.backend, "counter": counter, "messages": count}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def make_store(backend=STATE_BACKEND):
+    if backend == "sqlite":
+        return SQLiteStateStore()
+    if backend == "memory":
+        return MemoryStateStore()
+    raise ValueError(f"Unknown state backend {backend!r} (use 'memory' or 'sqlite')")
+
+
+class WriteBehindState:
+    """In-memory view of a state store that writes to it in the background.
+
+    Increments and new messages are answered from memory at once and
+    flushed to the store in one transaction every ``flush_interval``
+    seconds. Each flush also picks up changes made by other processes, so
+    they show up here after at most one interval. Only the newest
+    ``recent`` messages are kept in a ring buffer.
+
+    ``on_change(counter, rows)`` is called after each flush that changed the
+    counter or brought new messages, from whichever thread flushed.
+    """
+
+    def __init__(self, store, flush_interval=FLUSH_INTERVAL, recent=RECENT_MESSAGES,
+                 on_change=None):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.recent = recent
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counter, rows = store.apply(limit=recent)
+        self._messages = deque(rows, maxlen=recent)  # (id, body, client), stored messages only
+        self._last_id = rows[-1][0] if rows else 0
+        self._pending_increment = 0
+        self._pending = []
+        self._flushing_increment = 0
+        self._flushing = []
+        self._thread = None
+        self._stop = threading.Event()
+        self.flushes = 0
+        self.failures = 0
+
+    def increment(self, amount=1):
+        """Add to the counter; returns its new value"""
+        with self._lock:
+            self._pending_increment += amount
+        self._sync()
+        return self._value()
+
+    def add_message(self, body, client=None):
+        with self._lock:
+            self._pending.append((body, client))
+        self._sync()
+
+    def counter(self):
+        self._sync()
+        return self._value()
+
+    def _value(self):
+        with self._lock:
+            return self._counter + self._flushing_increment + self._pending_increment
+
+    def recent_messages(self):
+        """The newest messages as (id, body, client) tuples, oldest first.
+
+        Messages not flushed yet have no id (None).
+        """
+        self._sync()
+        with self._lock:
+            unsaved = [(None, body, client) for body, client in self._flushing + self._pending]
+            return (list(self._messages) + unsaved)[-self.recent:]
+
+    def oldest_id(self, messages):
+        """Id to page back from, for messages returned by recent_messages()"""
+        for message_id, _, _ in messages:
+            if message_id is not None:
+                return message_id
+        # Only unsaved messages are shown: page back from the newest stored one
+        with self._lock:
+            return self._last_id + 1
+
+    def older_messages(self, before, limit=RECENT_MESSAGES):
+        """The ``limit`` stored messages preceding id ``before``, oldest first"""
+        return self.store.messages_before(before, limit)
+
+    def _sync(self):
+        if self.flush_interval <= 0:
+            self.flush()
+        elif self._thread is None:
+            self._start()
+
+    def _start(self):
+        # Started on first use, so importing the app (e.g. in a reloader
+        # process) does not leave a flusher thread behind
+        with self._flush_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="state-flush", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error:
+                self.failures += 1  # retried with the next flush
+
+    def flush(self):
+        """Write pending changes and pick up other processes' changes"""
+        with self._flush_lock:
+            with self._lock:
+                self._flushing_increment, self._pending_increment = self._pending_increment, 0
+                self._flushing, self._pending = self._pending, []
+                after = self._last_id
+            try:
+                counter, rows = self.store.apply(self._flushing_increment, self._flushing, after,
+                                                 self.recent)
+            except BaseException:
+                # Keep the changes for the next flush
+                with self._lock:
+                    self._pending_increment += self._flushing_increment
+                    self._pending = self._flushing + self._pending
+                    self._flushing_increment, self._flushing = 0, []
+                raise
+            with self._lock:
+                changed = counter != self._counter or rows
+                self._counter = counter
+                self._messages.extend(rows)
+                if rows:
+                    self._last_id = rows[-1][0]
+                self._flushing_increment, self._flushing = 0, []
+            self.flushes += 1
+            # Still under the flush lock, so changes are reported in order
+            if changed and self.on_change is not None:
+                self.on_change(counter, rows)
+
+    def stats(self):
+        with self._lock:
+            pending = {"increment": self._pending_increment, "messages": len(self._pending)}
+        return {**self.store.stats(), "flush_interval": self.flush_interval,
+                "flushes": self.flushes, "failures": self.failures, "pending": pending}
+
+    def close(self):
+        """Stop the flusher and write what is left"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        self.store.close()
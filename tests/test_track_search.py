@@ -0,0 +1,99 @@
+import sqlite3
+
+import pytest
+
+import track_search
+
+TRACKS = [
+    "Lee 'Scratch' Perry - Chase the Devil",
+    "Lee's Dub Plate",
+    "Brenda Lee - Sweet Nothin's",
+    "Peggy Lee - Fever",
+    "Café del Mar - Energy 52",
+    "Cafe Tacvba - Eres",
+    "Beyoncé - Halo",
+    "AC/DC - Back in Black",
+    "Acid/Dub Experiment",
+    "Ace of Base - The Sign",
+    "Dub Syndicate - Ravi Shankar",
+    "Dubblestandart - Marijuana Hemp",
+    "Simple Minds - Alive & Kicking",
+    "Run-D.M.C. - It's Tricky",
+    "R&B Collective - Smooth",
+]
+
+# (previous query, extended query, narrowed in memory). A punctuation-only
+# word extended into a token word is left to the index.
+REFINEMENTS = [
+    # punctuation
+    ("lee '", "lee 's", False),
+    ("lee '", "lee 'sc", False),
+    ("'", "'s", False),
+    ("-", "-d", False),
+    ("&", "& k", True),
+    ("r&", "r&b", True),
+    ("run-", "run-d.m", True),
+    # diacritics
+    ("caf", "café", True),
+    ("beyonc", "beyoncé", True),
+    ("caf", "cafe", True),
+    # "/"-joined words
+    ("ac", "ac/", True),
+    ("ac/", "ac/dc", True),
+    ("ac", "ac/dc", True),
+    ("acid/", "acid/dub", True),
+    ("dub s", "dub sy", True),
+]
+
+
+@pytest.fixture(params=[True, False], ids=["fts", "like"])
+def conn(request):
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE tracks (track TEXT)")
+    conn.executemany("INSERT INTO tracks (track) VALUES (?)", [(t,) for t in TRACKS])
+    track_search.use_fts(request.param and track_search.ensure_fts_index(conn))
+    yield conn
+    track_search.use_fts(None)
+    conn.close()
+
+
+def tracks(conn, query):
+    return [row["track"] for row in track_search.search(conn, query)]
+
+
+@pytest.mark.parametrize("old, new, narrows", REFINEMENTS)
+def test_narrowed_results_match_search(conn, old, new, narrows):
+    store = track_search.RefinementStore()
+    store.remember("session", track_search.cache_key(old), tracks(conn, old), 0)
+    narrowed = store.narrow("session", track_search.cache_key(new), 0)
+    if narrows:
+        assert narrowed == tracks(conn, new)
+    else:
+        assert narrowed is None
+
+
+def test_punctuation_word_is_not_refined_by_token_word():
+    assert not track_search.refines(["lee", "'"], ["lee", "'s"])
+    assert track_search.refines(["lee", "'s"], ["lee", "'sc"])
+    assert track_search.refines(["-"], ["--"])
+
+
+def test_index_rebuilt_after_vacuum_renumbers_rows():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE tracks (track TEXT)")
+    conn.executemany("INSERT INTO tracks (track) VALUES (?)", [(f"Dub {i}",) for i in range(300)])
+    track_search.ensure_fts_index(conn)
+    conn.execute("DELETE FROM tracks WHERE rowid % 3 = 0")
+    conn.commit()
+    conn.execute("VACUUM")
+
+    track_search.ensure_fts_index(conn)
+    track_search.use_fts(True)
+    try:
+        expected = [row["track"] for row in track_search.search_like(conn, ["dub"])]
+        assert tracks(conn, "dub") == expected
+    finally:
+        track_search.use_fts(None)
+        conn.close()
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Searches per second each session may sustain, and the burst it may spend at once
+SEARCH_RATE = float(os.environ.get("RADIO_SEARCH_RATE", 10))
+SEARCH_BURST = float(os.environ.get("RADIO_SEARCH_BURST", 20))
+# Sessions tracked for rate limits and superseded searches
+MAX_TRACKED_SESSIONS = 10000
+
+
+class Superseded(Exception):
+    """Raised instead of running a search nobody is waiting for any more"""
+
+
+class RateLimiter:
+    """Token bucket per key: ``rate`` tokens a second, holding at most ``burst``"""
+
+    def __init__(self, rate=SEARCH_RATE, burst=SEARCH_BURST, max_keys=MAX_TRACKED_SESSIONS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, last refill)
+        self.limited = 0
+
+    def allow(self, key):
+        """Take a token for ``key``; False when its bucket is empty"""
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        else:
+            self.limited += 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed
+
+    def retry_after(self, key):
+        """Whole seconds until ``key`` has a token again"""
+        tokens, _ = self._buckets.get(key, (self.burst, 0))
+        return max(1, int((1 - tokens) / self.rate + 0.999))
+
+    def stats(self):
+        return {"rate": self.rate, "burst": self.burst, "limited": self.limited}
+
+
+class SessionCoalescer:
+    """Remembers each session's latest search, so older ones can be dropped.
+
+    ``begin()`` hands out a ticket; once the same session begins another
+    search, ``is_current()`` is False for the older ticket.
+    """
+
+    def __init__(self, max_sessions=MAX_TRACKED_SESSIONS):
+        self.max_sessions = max_sessions
+        self._latest = OrderedDict()  # session -> latest ticket
+        self._next = 0
+        self.superseded = 0
+
+    def begin(self, session_id):
+        self._next += 1
+        self._latest.pop(session_id, None)
+        self._latest[session_id] = self._next
+        if len(self._latest) > self.max_sessions:
+            self._latest.popitem(last=False)
+        return self._next
+
+    def is_current(self, session_id, ticket):
+        return self._latest.get(session_id, ticket) == ticket
+
+    def drop(self):
+        """Count a search dropped because it was superseded"""
+        self.superseded += 1
+
+    def stats(self):
+        return {"sessions": len(self._latest), "superseded": self.superseded}
+
+
+class SingleFlight:
+    """Runs identical concurrent calls once and shares the result.
+
+    Callers pass a ``wanted`` check; if none of the callers sharing a call
+    still wants it when a worker picks it up, it is skipped and every
+    caller gets Superseded.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self._flights = {}  # key -> (future, wanted checks)
+        self._lock = threading.Lock()
+        self.started = 0
+        self.shared = 0
+        self.skipped = 0
+
+    def _call(self, wanted, fn, args):
+        with self._lock:
+            checks = list(wanted)
+        if not any(check() for check in checks):
+            with self._lock:
+                self.skipped += 1
+            raise Superseded()
+        return fn(*args)
+
+    def _land(self, key, future):
+        if self._flights.get(key, (None,))[0] is future:
+            del self._flights[key]
+        if not future.cancelled():
+            future.exception()  # retrieved here in case every caller went away
+
+    async def run(self, key, fn, *args, wanted=None):
+        """Await ``fn(*args)`` on the executor, sharing it with identical calls"""
+        check = wanted or (lambda: True)
+        while True:
+            flight = self._flights.get(key)
+            if flight is None:
+                checks = [check]
+                future = asyncio.ensure_future(self.executor.run(self._call, checks, fn, args))
+                self._flights[key] = (future, checks)
+                future.add_done_callback(lambda done: self._land(key, done))
+                self.started += 1
+            else:
+                future, checks = flight
+                with self._lock:
+                    checks.append(check)
+                self.shared += 1
+            try:
+                # A caller going away must not cancel the call others are waiting for
+                return await asyncio.shield(future)
+            except Superseded:
+                # Joined a call that was skipped just before; run it again
+                if not check():
+                    raise
+
+    def stats(self):
+        return {"in_flight": len(self._flights), "started": self.started,
+                "shared": self.shared, "skipped": self.skipped}
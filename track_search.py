@@ -0,0 +1,495 @@
+import bisect
+import os
+import re
+import sqlite3
+import string
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from slow_log import SlowQueryLog
+
+# Full-text index over tracks.track, kept in sync by triggers on the tracks table
+FTS_TABLE = "tracks_fts"
+
+_FTS_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+        USING fts5(track, content='tracks', content_rowid='rowid', prefix='2 3')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON tracks BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, track) VALUES (new.rowid, new.track);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON tracks BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, track) VALUES ('delete', old.rowid, old.track);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF track ON tracks BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, track) VALUES ('delete', old.rowid, old.track);
+        INSERT INTO {FTS_TABLE}(rowid, track) VALUES (new.rowid, new.track);
+    END""",
+]
+
+# Set RADIO_FTS=0 to always use the LIKE scan (e.g. to compare engines)
+FTS_ENABLED = os.environ.get("RADIO_FTS", "1") != "0"
+
+# Result cache settings, overridable from the environment
+CACHE_ENTRIES = int(os.environ.get("RADIO_SEARCH_CACHE_ENTRIES", 1024))
+CACHE_ROWS = int(os.environ.get("RADIO_SEARCH_CACHE_ROWS", 200000))
+CACHE_TTL = float(os.environ.get("RADIO_SEARCH_CACHE_TTL", 300))
+
+# Per-session refinement settings: candidate sets larger than this are not kept
+REFINE_MAX_ROWS = int(os.environ.get("RADIO_REFINE_MAX_ROWS", 2000))
+REFINE_SESSIONS = int(os.environ.get("RADIO_REFINE_SESSIONS", 256))
+
+# Set by init_search_index(); None means "not checked yet"
+_fts_enabled = None
+
+# Searches over RADIO_SLOW_QUERY_MS are written to RADIO_SLOW_QUERY_LOG
+slow_queries = SlowQueryLog()
+
+
+def fts5_available(conn):
+    """Check whether this SQLite build has the FTS5 extension compiled in"""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _table_exists(conn, name):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = ?", (name,)
+    ).fetchone()
+    return row is not None
+
+
+def _stable_rowids(conn):
+    """Whether tracks has an INTEGER PRIMARY KEY, which VACUUM never renumbers"""
+    keys = [row for row in conn.execute("PRAGMA table_info(tracks)") if row[5]]
+    return len(keys) == 1 and keys[0][2].upper() == "INTEGER"
+
+
+def _index_out_of_sync(conn):
+    """Whether the FTS5 index no longer matches the rows of the tracks table"""
+    try:
+        conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('integrity-check', 1)")
+    except sqlite3.OperationalError:
+        return False  # e.g. a read-only connection, which could not rebuild it anyway
+    except sqlite3.DatabaseError:
+        return True
+    return False
+
+
+def ensure_fts_index(conn):
+    """Create and populate the FTS5 index (and its sync triggers) if missing.
+
+    Returns True when the index is ready to be queried.
+    """
+    if not _table_exists(conn, "tracks") or not fts5_available(conn):
+        return False
+
+    # Triggers are dropped together with the tracks table, so their absence
+    # means the index can no longer be trusted and must be rebuilt
+    needs_rebuild = not _table_exists(conn, f"{FTS_TABLE}_ai")
+    if not needs_rebuild and _table_exists(conn, FTS_TABLE) and not _stable_rowids(conn):
+        # The index refers to rows by rowid; without an INTEGER PRIMARY KEY,
+        # VACUUM may renumber them and leave the index pointing at other rows
+        needs_rebuild = _index_out_of_sync(conn)
+    with conn:
+        for statement in _FTS_SCHEMA:
+            conn.execute(statement)
+        if needs_rebuild:
+            conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def build_search_index(conn):
+    """Build the search index if possible; returns whether FTS5 can be used"""
+    if not FTS_ENABLED:
+        return False
+    try:
+        return ensure_fts_index(conn)
+    except sqlite3.OperationalError:
+        # e.g. read-only database file: keep serving through LIKE
+        return False
+
+
+def use_fts(enabled):
+    """Pick the search path: the FTS5 index, or LIKE scans"""
+    global _fts_enabled
+    _fts_enabled = enabled
+
+
+def fts_in_use():
+    """Whether searches currently go through the FTS5 index"""
+    return bool(_fts_enabled)
+
+
+def init_search_index(conn):
+    """Build the search index once at startup and pick the search path"""
+    use_fts(build_search_index(conn))
+    return _fts_enabled
+
+
+def warm_search_index(conn):
+    """Read the tracks table and FTS5 index once, so the first searches on a
+    newly opened file are not served from disk"""
+    conn.execute("SELECT COUNT(*), MAX(LENGTH(track)) FROM tracks").fetchone()
+    if _table_exists(conn, f"{FTS_TABLE}_data"):
+        conn.execute(f"SELECT COUNT(*), MAX(LENGTH(block)) FROM {FTS_TABLE}_data").fetchone()
+
+
+def normalize_query(query):
+    """Split a query into lowercase words"""
+    return [word.lower() for word in query.split()]
+
+
+def cache_key(query):
+    """Normalised word set: word order and repeats don't change the results"""
+    return tuple(sorted(set(normalize_query(query))))
+
+
+def fts_match_expression(words):
+    """Build an FTS5 query matching all words, each as a prefix"""
+    # Quoting turns each word into a phrase, so punctuation inside a word
+    # ("ac/dc") is tokenized the same way as the indexed text
+    return " AND ".join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+def _select(table, conditions, params, after=None, limit=None):
+    """Build the ordered, optionally keyset-paginated track query"""
+    if after is not None:
+        conditions = conditions + ["track > ?"]
+        params = params + [after]
+    sql_query = (
+        f"SELECT DISTINCT track FROM {table} "
+        f"WHERE {' AND '.join(conditions)} ORDER BY track"
+    )
+    if limit is not None:
+        sql_query += " LIMIT ?"
+        params = params + [limit]
+    return sql_query, params
+
+
+def _like_filter(words):
+    """Conditions matching tracks that contain every word as a substring"""
+    return ["LOWER(track) LIKE ?" for _ in words], [f"%{word}%" for word in words]
+
+
+def search_like(conn, words, after=None, limit=None):
+    """Search tracks containing all words as substrings (full table scan)"""
+    conditions, params = _like_filter(words)
+    return conn.execute(*_select("tracks", conditions, params, after, limit))
+
+
+def _has_token(word):
+    """Whether FTS5 would index anything in this word"""
+    return any(ch.isalnum() for ch in word)
+
+
+def _fts_filter(words):
+    """Conditions matching tracks through the FTS5 index"""
+    # Punctuation-only words ("-", "&") have no FTS tokens, so they are kept
+    # as substring filters on the rows the index returns
+    fts_words = [word for word in words if _has_token(word)]
+    like_words = [word for word in words if not _has_token(word)]
+
+    conditions = [f"{FTS_TABLE} MATCH ?"] + ["LOWER(track) LIKE ?" for _ in like_words]
+    params = [fts_match_expression(fts_words)] + [f"%{word}%" for word in like_words]
+    return conditions, params
+
+
+def search_fts(conn, words, after=None, limit=None):
+    """Search tracks containing all words as word prefixes via the FTS5 index"""
+    conditions, params = _fts_filter(words)
+    return conn.execute(*_select(FTS_TABLE, conditions, params, after, limit))
+
+
+def _search_query(words, after=None, limit=None):
+    """The search SQL and parameters for the engine in use"""
+    if _fts_enabled and any(_has_token(word) for word in words):
+        return _select(FTS_TABLE, *_fts_filter(words), after, limit)
+    return _select("tracks", *_like_filter(words), after, limit)
+
+
+def _fetch_logged(conn, sql_query, params, query, words):
+    """Fetch all rows, logging the query if it was slow"""
+    started = time.perf_counter()
+    rows = conn.execute(sql_query, params).fetchall()
+    slow_queries.record(conn, sql_query, params, time.perf_counter() - started,
+                        query, words, len(rows))
+    return rows
+
+
+def execute_search(conn, query, after=None, limit=None):
+    """Run the search and return the cursor, for fetching rows incrementally.
+
+    Results are ordered by track; pass the last track of a page as ``after``
+    to fetch the next page.
+    """
+    return conn.execute(*_search_query(normalize_query(query), after, limit))
+
+
+def search(conn, query, after=None, limit=None):
+    """Search tracks containing all words of the query (case-insensitive)"""
+    words = normalize_query(query)
+    if not words:
+        return []
+    return _fetch_logged(conn, *_search_query(words, after, limit), query, words)
+
+
+def _rank_tier(words, use_fts):
+    """SQL expression ranking how closely a track matches the query.
+
+    3: the whole track is the query, 2: the query occurs as a phrase
+    starting at a word, 1: every word starts a word, 0: substrings only.
+    FTS5 matches are always word prefixes, so they rank at least 1.
+    """
+    phrase = " ".join(words)
+    prefix_tier = "1"
+    params = [phrase, f"% {phrase}%"]
+    if not use_fts:
+        prefix_conditions = " AND ".join("(' ' || LOWER(track)) LIKE ?" for _ in words)
+        prefix_tier = f"CASE WHEN {prefix_conditions} THEN 1 ELSE 0 END"
+        params += [f"% {word}%" for word in words]
+    sql = (
+        "CASE WHEN LOWER(track) = ? THEN 3 "
+        "WHEN (' ' || LOWER(track)) LIKE ? THEN 2 "
+        f"ELSE {prefix_tier} END"
+    )
+    return sql, params
+
+
+def search_ranked(conn, query, limit):
+    """Best ``limit`` distinct tracks: exact and phrase matches first.
+
+    Ties are broken by BM25 when the FTS5 index is used and by length
+    otherwise. ORDER BY ... LIMIT lets SQLite keep only the top rows while
+    scanning instead of sorting every match.
+    """
+    words = normalize_query(query)
+    if not words:
+        return []
+
+    use_fts = bool(_fts_enabled) and any(_has_token(word) for word in words)
+    tier_sql, tier_params = _rank_tier(words, use_fts)
+    if use_fts:
+        conditions, params = _fts_filter(words)
+        table, tie_break = FTS_TABLE, f"bm25({FTS_TABLE})"
+    else:
+        conditions, params = _like_filter(words)
+        table, tie_break = "tracks", "LENGTH(track)"
+    sql_query = (
+        f"SELECT track FROM {table} WHERE {' AND '.join(conditions)} "
+        f"ORDER BY {tier_sql} DESC, {tie_break}, track LIMIT ?"
+    )
+
+    # The same track can appear several times; fetch more until there are
+    # enough distinct names or no more matches
+    fetch = limit * 2
+    while True:
+        rows = _fetch_logged(conn, sql_query, params + tier_params + [fetch], query, words)
+        results, seen = [], set()
+        for row in rows:
+            if row[0] not in seen:
+                seen.add(row[0])
+                results.append(row)
+                if len(results) == limit:
+                    return results
+        if len(rows) < fetch:
+            return results
+        fetch *= 4
+
+class SearchCache:
+    """LRU cache of search results with a TTL and a bound on cached rows.
+
+    Entries are tagged with the catalogue generation from ``version()`` (see
+    db.CatalogueVersion); when the tracks change, the whole cache is dropped.
+    Cached result lists are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, version, max_entries=CACHE_ENTRIES, max_rows=CACHE_ROWS,
+                 ttl=CACHE_TTL):
+        self.version = version
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+
+        self._entries = OrderedDict()  # key -> (expires_at, results)
+        self._rows = 0
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _clear(self):
+        self._entries.clear()
+        self._rows = 0
+
+    def _check_generation(self):
+        """Drop everything if the catalogue changed; return the generation"""
+        generation = self.version()
+        with self._lock:
+            if generation != self._generation:
+                if self._generation is not None:
+                    self.invalidations += 1
+                self._clear()
+                self._generation = generation
+        return generation
+
+    def get(self, key):
+        """Return ``(results, generation)``; results is None on a miss"""
+        generation = self._check_generation()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], generation
+            if entry is not None:
+                del self._entries[key]
+                self._rows -= len(entry[1])
+            self.misses += 1
+            return None, generation
+
+    def put(self, key, results, generation):
+        """Store results computed while the catalogue was at ``generation``"""
+        if len(results) > self.max_rows:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return  # the catalogue changed while the query ran
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._rows -= len(old[1])
+            self._entries[key] = (time.monotonic() + self.ttl, results)
+            self._rows += len(results)
+            while (len(self._entries) > self.max_entries
+                   or self._rows > self.max_rows):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._rows -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "rows": self._rows,
+                    "hits": self.hits, "misses": self.misses,
+                    "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                    "evictions": self.evictions,
+                    "invalidations": self.invalidations}
+
+
+# In-memory equivalents of the SQL matching rules, used to filter candidates.
+# SQLite's LOWER() and LIKE only fold ASCII letters; FTS5's unicode61
+# tokenizer splits on anything that is not a letter or digit, folds case and
+# strips diacritics.
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    """Approximate the FTS5 unicode61 tokenizer"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(folded)
+
+
+def _word_matcher(word, use_fts):
+    """Predicate over a candidate that mirrors how the database matches word"""
+    if use_fts and _has_token(word):
+        # Candidates keep their tokens as " tok1 tok2 ...", so a phrase whose
+        # last token is a prefix is a plain substring starting at a space
+        needle = " " + " ".join(tokenize(word))
+        return lambda candidate: needle in candidate[2]
+    return lambda candidate: word in candidate[1]
+
+
+def make_candidates(tracks):
+    """Precompute the folded forms of tracks for in-memory filtering"""
+    return [
+        (track, track.translate(_ASCII_LOWER), " " + " ".join(tokenize(track)))
+        for track in tracks
+    ]
+
+
+def refines(old_words, new_words):
+    """True when every track matching new_words also matches old_words"""
+    # A longer word can only match fewer tracks, both as a substring and as a
+    # word prefix. Punctuation-only words are substring filters in FTS mode,
+    # so they can only be narrowed by other punctuation-only words: "lee 's"
+    # matches the token "s", not the text "'".
+    return all(
+        any(new.startswith(old) and (_has_token(old) or not _has_token(new))
+            for new in new_words)
+        for old in old_words
+    )
+
+
+def page(tracks, after=None, limit=None):
+    """Slice a sorted track list the way keyset pagination does"""
+    start = 0 if after is None else bisect.bisect_right(tracks, after)
+    return tracks[start:] if limit is None else tracks[start:start + limit]
+
+
+class RefinementStore:
+    """Per-session candidate sets from the previous search.
+
+    When a user extends their query ("dub s" -> "dub si") the new results
+    are a subset of the previous ones, so they are filtered from the
+    remembered candidates in memory instead of querying the database.
+    """
+
+    def __init__(self, max_sessions=REFINE_SESSIONS, max_rows=REFINE_MAX_ROWS):
+        self.max_sessions = max_sessions
+        self.max_rows = max_rows
+        self._sessions = OrderedDict()  # session id -> (generation, words, candidates)
+        self._lock = threading.Lock()
+        self.narrowed = 0
+
+    def narrow(self, session_id, words, generation):
+        """Return the sorted tracks matching words, or None to use the index"""
+        if session_id is None:
+            return None
+        # % and _ are LIKE wildcards, which the in-memory filter doesn't emulate
+        if any("%" in word or "_" in word for word in words):
+            return None
+        with self._lock:
+            entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        entry_generation, old_words, candidates = entry
+        if entry_generation != generation or not refines(old_words, words):
+            return None
+
+        if words != old_words:
+            use_fts = bool(_fts_enabled) and any(_has_token(word) for word in words)
+            # Every candidate already matches the words carried over unchanged
+            matchers = [_word_matcher(word, use_fts) for word in words
+                        if word not in old_words]
+            candidates = [c for c in candidates if all(match(c) for match in matchers)]
+            self._store(session_id, (generation, words, candidates))
+        with self._lock:
+            self.narrowed += 1
+        return [candidate[0] for candidate in candidates]
+
+    def remember(self, session_id, words, tracks, generation):
+        """Keep the complete, sorted result of a query for later narrowing"""
+        if session_id is None or len(tracks) > self.max_rows:
+            return
+        self._store(session_id, (generation, words, make_candidates(tracks)))
+
+    def _store(self, session_id, entry):
+        with self._lock:
+            self._sessions[session_id] = entry
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions), "narrowed": self.narrowed}